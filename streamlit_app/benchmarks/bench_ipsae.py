@@ -0,0 +1,149 @@
+# bench_ipsae.py
+# Stage-level benchmark of the ipSAE engine in ipsae.py on synthetic AF3 complexes (see synthetic_af3.py)
+#
+# Usage:
+#  python benchmarks/bench_ipsae.py                                  all cases, results in ipsae_benchmark.json
+#  python benchmarks/bench_ipsae.py --cases small_2ch,medium_4ch_ligand --repeat 5 --output before.json
+#  python benchmarks/bench_ipsae.py --list
+#
+# Stages (seconds, best of --repeat runs):
+#   parse            read_structure (mmCIF atom records)
+#   pae_load         load_pae (full_data json: PAE, atom pLDDTs)
+#   contacts         interchain contact search (ContactList)
+#   pdockq_pdockq2   pDockQ and pDockQ2 (computed together in one pass over the contacts)
+#   lis              LIS
+#   iptm_ipsae       ipTM/ipSAE by residue, interface counts, asym and max values
+#   output           summary .txt and .pml files
+#   output_byres     per-residue _byres.txt file
+#   score_model      score_model end to end (contacts through max values)
+#
+# The synthetic inputs are written to --data-dir once and reused by later runs.
+
+import os, sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ipsae
+import synthetic_af3
+
+# name: chain specs (chain_type, ntokens); 200 to 5000 tokens, 2 to 24 chains, with and without ligands and nucleic acids
+cases = {
+    'small_2ch':          [('protein', 120), ('protein', 80)],
+    'medium_4ch_ligand':  [('protein', 320), ('protein', 300), ('protein', 340), ('ligand', 40)],
+    'medium_6ch_na':      [('protein', 400)] * 4 + [('dna', 200), ('dna', 200)],
+    'large_8ch_mixed':    [('protein', 550)] * 5 + [('rna', 300), ('dna', 225), ('ligand', 225)],
+    'xlarge_12ch_mixed':  [('protein', 480)] * 9 + [('dna', 300), ('dna', 300), ('ligand', 80)],
+    'sparse_24ch':        [('protein', 200)] * 24,
+}
+# cases whose chains are laid out in a line (each chain touches only its neighbours); the others are compact
+filament_cases = {'sparse_24ch'}
+
+
+def time_stage(timings, stage, function, *args, **kwargs):
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    timings[stage] = min(timings.get(stage, elapsed), elapsed)
+    return value
+
+
+def run_case(name, chain_specs, data_dir, repeat, pae_cutoff, dist_cutoff):
+    layout = 'filament' if name in filament_cases else 'compact'
+    cif_path, full_data_path, _ = synthetic_af3.write_complex(data_dir, name, chain_specs, layout=layout)
+    timings = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_path = os.path.join(output_dir, os.path.basename(cif_path))
+        for _ in range(repeat):
+            structure = time_stage(timings, 'parse', ipsae.read_structure, cif_path, True)
+            pae = time_stage(timings, 'pae_load', ipsae.load_pae, full_data_path, structure, 'af3')
+            pae_matrix = pae.pae_matrix
+
+            contacts = time_stage(timings, 'contacts', ipsae.ContactList, structure, max(ipsae.pDockQ_cutoff, dist_cutoff))
+            result = ipsae.IpsaeResult(structure, pae, pae_cutoff, dist_cutoff)
+            time_stage(timings, 'pdockq_pdockq2', ipsae.compute_pdockq, result, pae_matrix, pae.cb_plddt, contacts)
+            time_stage(timings, 'lis', ipsae.compute_lis, result, pae_matrix)
+
+            def iptm_ipsae():
+                ipsae.compute_chain_pair_ipsae([result], pae_matrix)
+                ipsae.compute_asym_max(result)
+                ipsae.compute_dist_interface(result, pae_matrix, contacts)
+            time_stage(timings, 'iptm_ipsae', iptm_ipsae)
+
+            time_stage(timings, 'output', ipsae.write_outputs, result, output_path, ('txt', 'pml'))
+            time_stage(timings, 'output_byres', ipsae.write_outputs, result, output_path, ('byres',))
+            time_stage(timings, 'score_model', ipsae.score_model, structure, pae, pae_cutoff, dist_cutoff)
+
+    return {'name':         name,
+            'ntokens':      int(len(structure.token_array)),
+            'nresidues':    int(structure.numres),
+            'nchains':      len(chain_specs),
+            'chain_types':  sorted({chain_type for chain_type, _ in chain_specs}),
+            'ligand':       any(chain_type == 'ligand' for chain_type, _ in chain_specs),
+            'nucleic_acid': any(chain_type in ('dna', 'rna') for chain_type, _ in chain_specs),
+            'layout':       layout,
+            'interacting_pairs': sum(flag for pairs in result.interacting.values() for flag in pairs.values()),
+            'ncontacts':    int(len(contacts.i)),
+            'full_data_mb': round(os.path.getsize(full_data_path) / 1024**2, 2),
+            'stages':       {stage: round(seconds, 6) for stage, seconds in timings.items()}}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stage-level benchmark of ipsae.py on synthetic AF3 complexes")
+    parser.add_argument("--cases", default=",".join(cases), help="comma-separated case names (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the best time of each stage is kept")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "ipsae_benchmark_data"),
+                        help="directory for the synthetic inputs (reused between runs)")
+    parser.add_argument("--output", default="ipsae_benchmark.json", help="JSON results file")
+    parser.add_argument("--pae-cutoff", type=float, default=10.0)
+    parser.add_argument("--dist-cutoff", type=float, default=15.0)
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, chain_specs in cases.items():
+            print(f"{name:20s} {sum(n for _, n in chain_specs):5d} tokens  {len(chain_specs):2d} chains  "
+                  f"{', '.join(sorted({chain_type for chain_type, _ in chain_specs}))}")
+        return
+
+    selected = args.cases.split(",")
+    unknown = [name for name in selected if name not in cases]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+
+    results = {'benchmark':   'ipsae',
+               'created':     time.strftime("%Y-%m-%dT%H:%M:%S"),
+               'commit':      git_commit(),
+               'python':      platform.python_version(),
+               'numpy':       np.__version__,
+               'platform':    platform.platform(),
+               'repeat':      args.repeat,
+               'pae_cutoff':  args.pae_cutoff,
+               'dist_cutoff': args.dist_cutoff,
+               'cases':       []}
+    for name in selected:
+        case = run_case(name, cases[name], args.data_dir, args.repeat, args.pae_cutoff, args.dist_cutoff)
+        results['cases'].append(case)
+        stages = "  ".join(f"{stage} {seconds:.3f}" for stage, seconds in case['stages'].items())
+        print(f"{name:20s} {case['ntokens']:5d} tokens  {stages}", flush=True)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=1)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
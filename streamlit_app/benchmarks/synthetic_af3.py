@@ -0,0 +1,130 @@
+# synthetic_af3.py
+# Synthetic AlphaFold3 server-style outputs for benchmarking ipsae.py:
+#     fold_<name>_model_0.cif, fold_<name>_full_data_0.json, fold_<name>_summary_confidences_0.json
+#
+# A complex is a list of (chain_type, ntokens) with chain_type in 'protein', 'dna', 'rna', 'ligand'.
+# Proteins and nucleic acids have one token per residue; ligands have one token per atom (like AF3).
+# Coordinates are random compact clouds around chain centres; the PAE grows with distance plus noise.
+# layout='compact' puts the centres on a loose random walk so most chains touch each other,
+# layout='filament' puts them on a line so each chain only touches its neighbours (most pairs non-interacting).
+#
+# Usage:
+#  import synthetic_af3
+#  paths = synthetic_af3.write_complex("bench_data", "case1", [('protein', 300), ('dna', 40), ('ligand', 30)])
+
+import os
+import json
+import numpy as np
+
+amino_acids = ["ALA", "ARG", "ASN", "ASP", "CYS", "GLN", "GLU", "GLY", "HIS", "ILE",
+               "LEU", "LYS", "MET", "PHE", "PRO", "SER", "THR", "TRP", "TYR", "VAL"]
+dna_bases = ["DA", "DC", "DG", "DT"]
+rna_bases = ["A", "C", "G", "U"]
+
+atom_site_fields = ["group_PDB", "id", "type_symbol", "label_atom_id", "label_alt_id", "label_comp_id",
+                    "label_asym_id", "label_entity_id", "label_seq_id", "pdbx_PDB_ins_code",
+                    "Cartn_x", "Cartn_y", "Cartn_z", "occupancy", "B_iso_or_equiv",
+                    "auth_seq_id", "auth_asym_id", "pdbx_PDB_model_num"]
+
+# atoms written for each residue (offsets from the token position); the token atom is CA or C1'
+protein_atoms = (("N", "N", -1.2), ("CA", "C", 0.0), ("C", "C", 1.2), ("O", "O", 1.9), ("CB", "C", 0.8))
+nucleic_atoms = (("P", "P", -1.5), ("C1'", "C", 0.0), ("C3'", "C", 0.9))
+
+
+def chain_ids(nchains):
+    return [chr(ord('A') + n) for n in range(nchains)]
+
+
+def token_coordinates(chain_specs, rng, layout='compact'):
+    # tokens in a compact cloud around each chain centre
+    coordinates = []
+    center = np.zeros(3)
+    for _, ntokens in chain_specs:
+        radius = 2.2 * max(ntokens, 1) ** (1.0/3.0)
+        if layout == 'filament':
+            center = center + np.array([1.8 * radius, 0.0, 0.0])
+        else:
+            center = center + rng.normal(0.0, 1.0, 3) / np.sqrt(3) * 1.6 * radius
+        coordinates.append(center + rng.normal(0.0, radius / 1.7, (ntokens, 3)))
+    return coordinates
+
+
+def write_cif(path, chain_specs, coordinates, rng):
+    lines = ["data_synthetic", "#", "loop_"] + ["_atom_site." + field for field in atom_site_fields]
+    atom_id = 0
+    for entity, ((chain_type, ntokens), chain, xyz) in enumerate(zip(chain_specs, chain_ids(len(chain_specs)), coordinates), start=1):
+        for n in range(ntokens):
+            if chain_type == 'ligand':
+                atoms = ((f"C{n+1}", "C", 0.0),)
+                group, residue, seq, auth_seq = "HETATM", "LIG", ".", "1"
+            elif chain_type == 'protein':
+                residue = amino_acids[rng.integers(len(amino_acids))]
+                atoms = protein_atoms if residue != "GLY" else protein_atoms[:4]
+                group, seq = "ATOM", str(n + 1)
+                auth_seq = seq
+            else:
+                bases = dna_bases if chain_type == 'dna' else rna_bases
+                residue = bases[n % 4]
+                atoms = nucleic_atoms
+                group, seq = "ATOM", str(n + 1)
+                auth_seq = seq
+            for atom_name, element, offset in atoms:
+                atom_id += 1
+                x, y, z = xyz[n] + offset
+                lines.append(f"{group} {atom_id} {element} {atom_name} . {residue} {chain} {entity} {seq} ? "
+                             f"{x:.3f} {y:.3f} {z:.3f} 1.00 {rng.uniform(30, 95):.2f} {auth_seq} {chain} 1")
+    lines.append("#")
+    with open(path, 'w') as file:
+        file.write("\n".join(lines) + "\n")
+    return atom_id
+
+
+def json_matrix(matrix):
+    # same layout as the AF3 server: [[0.76, 1.02, ...], [...], ...]
+    return "[" + ", ".join("[" + ", ".join(map("%.2f".__mod__, row)) + "]" for row in matrix.tolist()) + "]"
+
+
+def write_full_data(path, chain_specs, coordinates, natoms, rng):
+    xyz = np.concatenate(coordinates)
+    ntokens = len(xyz)
+    token_chains = np.repeat(chain_ids(len(chain_specs)), [ntokens for _, ntokens in chain_specs])
+    distance = np.sqrt(((xyz[:, None, :] - xyz[None, :, :])**2).sum(axis=2))
+    pae = np.clip(0.35 * distance + rng.normal(0.0, 2.0, distance.shape), 0.25, 31.75)
+    contact_probs = np.clip(1.0 - distance / 12.0, 0.0, 1.0)
+    atom_plddts = rng.uniform(30, 95, natoms)
+    with open(path, 'w') as file:
+        file.write('{"atom_chain_ids": [], "atom_plddts": [' + ", ".join(map("%.2f".__mod__, atom_plddts.tolist())) + '], ')
+        file.write('"contact_probs": ' + json_matrix(contact_probs) + ', ')
+        file.write('"pae": ' + json_matrix(pae) + ', ')
+        file.write('"token_chain_ids": ' + json.dumps(token_chains.tolist()) + ', ')
+        file.write('"token_res_ids": ' + json.dumps(list(range(1, ntokens + 1))) + '}')
+
+
+def write_summary_confidences(path, chain_specs, rng):
+    nchains = len(chain_specs)
+    chain_pair_iptm = np.round(rng.uniform(0.05, 0.95, (nchains, nchains)), 2)
+    summary = {"chain_iptm": np.round(chain_pair_iptm.mean(axis=1), 2).tolist(),
+               "chain_pair_iptm": chain_pair_iptm.tolist(),
+               "chain_ptm": np.round(rng.uniform(0.3, 0.9, nchains), 2).tolist(),
+               "iptm": round(float(chain_pair_iptm.mean()), 2),
+               "ptm": round(float(rng.uniform(0.3, 0.9)), 2),
+               "ranking_score": round(float(rng.uniform(0.3, 0.9)), 2)}
+    with open(path, 'w') as file:
+        json.dump(summary, file)
+
+
+# Write one synthetic complex to directory/name/ and return its (cif, full_data, summary_confidences) paths.
+# Existing files are reused unless overwrite=True (large cases take a while to format).
+def write_complex(directory, name, chain_specs, seed=0, layout='compact', overwrite=False):
+    job_path = os.path.join(directory, name)
+    os.makedirs(job_path, exist_ok=True)
+    cif_path = os.path.join(job_path, f"fold_{name}_model_0.cif")
+    full_data_path = os.path.join(job_path, f"fold_{name}_full_data_0.json")
+    summary_path = os.path.join(job_path, f"fold_{name}_summary_confidences_0.json")
+    if overwrite or not all(os.path.exists(path) for path in (cif_path, full_data_path, summary_path)):
+        rng = np.random.default_rng(seed)
+        coordinates = token_coordinates(chain_specs, rng, layout)
+        natoms = write_cif(cif_path, chain_specs, coordinates, rng)
+        write_full_data(full_data_path, chain_specs, coordinates, natoms, rng)
+        write_summary_confidences(summary_path, chain_specs, rng)
+    return cif_path, full_data_path, summary_path
@@ -25,92 +25,55 @@
 #  python ipsae.py <path_to_boltz_pae_npz_file>  <path_to_boltz_cif_file>   <pae_cutoff> <dist_cutoff>
 #  python ipsae.py <path_to_boltz_pae_npz_file>  <path_to_boltz_pdb_file>   <pae_cutoff> <dist_cutoff>
 #
+# Comma-separated cutoffs (e.g. 5,10,15 8,10,15) score every combination in one run and add a _sweep.txt table
+# --byres also writes the per-residue _byres.txt file (not written by default)
+# --profile / --profile-log <file> report (and append as JSON lines) per-stage time, memory and element counts
+# --outputs txt,pml,byres,json,parquet,arrow,byres_json,byres_parquet,byres_arrow selects the files to write
+# (Parquet and Arrow need pyarrow:  pip install pyarrow)
+#
 # All output files will be in same path/folder as cif or pdb file
+#
+# Usage as a module (no global state; safe to call repeatedly and from worker threads):
+#
+#  import ipsae
+#  structure = ipsae.read_structure("fold_aurka_tpx2_model_0.cif")
+#  pae       = ipsae.load_pae("fold_aurka_tpx2_full_data_0.json", structure)
+#  result    = ipsae.score_model(structure, pae, pae_cutoff=10, dist_cutoff=15)
+#  result.ipsae_d0res_asym['A']['B']
+#
+#  or in one call:   result = ipsae.score_files(pae_file_path, pdb_path, 10, 15)
+#
+#  cutoff sweep:      results = ipsae.score_sweep(structure, pae, [5, 10, 15], [8, 10, 15])
+#                     results[(10, 15)].ipsae_d0res_asym['A']['B']
+#
+#  instrumentation:   profile = ipsae.ScoreProfile()
+#                     result  = ipsae.score_files(pae_file_path, pdb_path, 10, 15, profile=profile)
+#                     profile.record()   or   profile.append_to("ipsae_profile.jsonl")
 
 import sys, os, math
+import copy
 import json
+import mmap
+import time
+import contextlib
+import threading
+import tracemalloc
 import numpy as np
-np.set_printoptions(threshold=np.inf)  # for printing out full numpy arrays for debugging
-
-
-# Input and output files and parameters
-
-# Ensure correct usage
-if len(sys.argv) < 5:
-    print("Usage for AF2 (PDB format):")
-    print("   python ipsae.py <path_to_pae_json_file> <path_to_pdb_file> <pae_cutoff> <dist_cutoff>")
-    print("   python ipsae.py RAF1_KSR1_scores_rank_001_alphafold2_multimer_v3_model_4_seed_003.json RAF1_KSR1_unrelaxed_rank_001_alphafold2_multimer_v3_model_4_seed_003.pdb 10 15")
-    print("")
-    print("Usage for AF3 (mmCIF format):")
-    print("   python ipsae.py <path_to_pae_json_file> <path_to_mmcif_file> <pae_cutoff> <dist_cutoff>")
-    print("   python ipsae.py fold_aurka_tpx2_full_data_0.json  fold_aurka_tpx2_model_0.cif 10 15")
-    print("")
-    print("Usage for Boltz (PDB or mmCIF format):")
-    print("   python ipsae.py <path_to_pae_npz_file> <path_to_mmcif_file> <pae_cutoff> <dist_cutoff>")
-    print("   python ipsae.py <path_to_pae_npz_file> <path_to_pdb_file> <pae_cutoff> <dist_cutoff>")
-    print("   python ipsae.py pae_AURKA_TPX2_model_0.npz  AURKA_TPX2_model_0.cif 10 15")
-    print("   python ipsae.py pae_AURKA_TPX2_model_0.npz  AURKA_TPX2_model_0.pdb 10 15")
-
-    sys.exit(1)
-
-pae_file_path =    sys.argv[1]
-pdb_path =         sys.argv[2]
-pae_cutoff =       float(sys.argv[3])
-dist_cutoff =      float(sys.argv[4])
-pae_string =       str(int(pae_cutoff))
-if pae_cutoff<10:  pae_string="0"+pae_string
-dist_string =      str(int(dist_cutoff))
-if dist_cutoff<10: dist_string="0"+dist_string
-
-if ".pdb" in pdb_path and pae_file_path.endswith(".json"):
-    pdb_stem=pdb_path.replace(".pdb","")
-    path_stem =     f'{pdb_path.replace(".pdb","")}_{pae_string}_{dist_string}'
-    af2 =    True
-    af3 =    False
-    boltz =  False
-    cif =    False
-
-elif ".cif" in pdb_path and pae_file_path.endswith(".json"):
-    pdb_stem=pdb_path.replace(".cif","")
-    path_stem =     f'{pdb_path.replace(".cif","")}_{pae_string}_{dist_string}'
-    af2 =    False
-    af3 =    True
-    boltz =  False
-    cif =    True
-
-elif ".cif" in pdb_path and pae_file_path.endswith(".npz"):  # Boltz1/2 in cif format
-    pdb_stem=pdb_path.replace(".cif","")
-    path_stem =     f'{pdb_path.replace(".cif","")}_{pae_string}_{dist_string}'
-    af2 =    False
-    af3 =    False
-    boltz  = True
-    cif =    True
-
-elif ".pdb" in pdb_path and pae_file_path.endswith(".npz"):  # Boltz1/2 in pdb format
-    pdb_stem=pdb_path.replace(".pdb","")
-    path_stem =     f'{pdb_path.replace(".pdb","")}_{pae_string}_{dist_string}'
-    af2 =    False
-    af3 =    False
-    boltz  = True
-    cif =    False
-
-else:
-    print("Wrong PDB or PAE file type ", pdb_path)
-    sys.exit()
-
-file_path =        path_stem + ".txt"
-file2_path =       path_stem + "_byres.txt"
-pml_path =         path_stem + ".pml"
-OUT =              open(file_path,'w')
-PML =              open(pml_path,'w')
-OUT2 =             open(file2_path,'w')
-
+try:
+    import resource  # peak memory reporting; not available on Windows
+except ImportError:
+    resource = None
+try:
+    import pyarrow as pa  # optional: Parquet and Arrow IPC output
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 
 
 # Define the ptm and d0 functions
 def ptm_func(x,d0):
     return 1.0/(1+(x/d0)**2.0)
-ptm_func_vec=np.vectorize(ptm_func)  # vector version
 
 # Define the d0 functions for numbers and arrays; minimum value = 1.0; from Yang and Skolnick, PROTEINS: Structure, Function, and Bioinformatics 57:702–710 (2004)
 def calc_d0(L,pair_type):
@@ -136,133 +99,26 @@ def calc_d0_array(L, pair_type):
     return np.maximum(min_value, 1.24 * (L - 15) ** (1.0/3.0) - 1.8)
 
 
-# Define the parse_atom_line function for PDB lines (by column) and mmCIF lines (split by white_space)
-# parsed_line = parse_atom_line(line)
-# line = "ATOM    123  CA  ALA A  15     11.111  22.222  33.333  1.00 20.00           C"
-def parse_pdb_atom_line(line):
-    atom_num = line[6:11].strip()
-    atom_name = line[12:16].strip()
-    residue_name = line[17:20].strip()
-    if residue_name == "LIG": return None  # ligands in Boltz PDB-format files
-    chain_id = line[21].strip()
-    residue_seq_num = line[22:26].strip()
-    x = line[30:38].strip()
-    y = line[38:46].strip()
-    z = line[46:54].strip()
-
-    # Convert string numbers to integers or floats as appropriate
-    atom_num = int(atom_num)
-    residue_seq_num = int(residue_seq_num)
-    x = float(x)
-    y = float(y)
-    z = float(z)
-
-    return {
-        'atom_num': atom_num,
-        'atom_name': atom_name,
-        'residue_name': residue_name,
-        'chain_id': chain_id,
-        'residue_seq_num': residue_seq_num,
-        'x': x,
-        'y': y,
-        'z': z
-    }
-
-def parse_cif_atom_line(line,fielddict):
-    # for parsing AF3 and Boltz1/2 mmCIF files
-    # ligands do not have residue numbers but modified residues do. Return "None" for ligand.
-    # AF3 mmcif lines
-    # 0      1   2   3     4  5  6 7  8  9  10      11     12      13   14    15 16 17
-    #ATOM   1294 N   N     . ARG A 1 159 ? 5.141   -14.096 10.526  1.00 95.62 159 A 1
-    #ATOM   1295 C   CA    . ARG A 1 159 ? 4.186   -13.376 11.366  1.00 96.27 159 A 1
-    #ATOM   1296 C   C     . ARG A 1 159 ? 2.976   -14.235 11.697  1.00 96.42 159 A 1
-    #ATOM   1297 O   O     . ARG A 1 159 ? 2.654   -15.174 10.969  1.00 95.46 159 A 1
-    # ...
-    #HETATM 1305 N   N     . TPO A 1 160 ? 2.328   -13.853 12.742  1.00 96.42 160 A 1
-    #HETATM 1306 C   CA    . TPO A 1 160 ? 1.081   -14.560 13.218  1.00 96.78 160 A 1
-    #HETATM 1307 C   C     . TPO A 1 160 ? -2.115  -11.668 12.263  1.00 96.19 160 A 1
-    #HETATM 1308 O   O     . TPO A 1 160 ? -1.790  -11.556 11.113  1.00 95.75 160 A 1
-    # ...
-    #HETATM 2608 P   PG    . ATP C 3 .   ? -6.858  4.182   10.275  1.00 84.94 1   C 1
-    #HETATM 2609 O   O1G   . ATP C 3 .   ? -6.178  5.238   11.074  1.00 75.56 1   C 1
-    #HETATM 2610 O   O2G   . ATP C 3 .   ? -5.889  3.166   9.748   1.00 75.15 1   C 1
-    # ...
-    #HETATM 2639 MG  MG    . MG  D 4 .   ? -7.262  2.709   4.825   1.00 91.47 1   D 1
-    #HETATM 2640 MG  MG    . MG  E 5 .   ? -4.994  2.251   8.755   1.00 85.96 1   E 1
-
-
-    # Boltz1 mmcif files (in non-standard order))
-    #_atom_site.group_PDB
-    #_atom_site.id
-    #_atom_site.type_symbol
-    #_atom_site.label_atom_id
-    #_atom_site.label_alt_id
-    #_atom_site.label_comp_id
-    #_atom_site.label_seq_id
-    #_atom_site.auth_seq_id
-    #_atom_site.pdbx_PDB_ins_code
-    #_atom_site.label_asym_id
-    #_atom_site.Cartn_x
-    #_atom_site.Cartn_y
-    #_atom_site.Cartn_z
-    #_atom_site.occupancy
-    #_atom_site.label_entity_id
-    #_atom_site.auth_asym_id
-    #_atom_site.auth_comp_id
-    #_atom_site.B_iso_or_equiv
-    #_atom_site.pdbx_PDB_model_num
-    # 0     1     2  3     4   5   6    7   8  9  10          11         12       13  14 15 16  17 18
-    #ATOM   2652  N  N     . ASN  43   43   ?  B  10.83538   6.06359    18.45139   1  2  B  ASN  1  1
-    #ATOM   2653  C  CA    . ASN  43   43   ?  B  10.76295   5.07366    19.53232   1  2  B  ASN  1  1
-    #ATOM   2654  C  C     . ASN  43   43   ?  B  11.21770   5.64437    20.88774   1  2  B  ASN  1  1
-    #ATOM   2655  O  O     . ASN  43   43   ?  B  12.06730   6.51688    20.91168   1  2  B  ASN  1  1
-    #ATOM   2656  C  CB    . ASN  43   43   ?  B  11.60137   3.84778    19.19481   1  2  B  ASN  1  1
-    #ATOM   2657  C  CG    . ASN  43   43   ?  B  10.96208   3.03997    18.07013   1  2  B  ASN  1  1
-    #ATOM   2658  O  OD1   . ASN  43   43   ?  B  9.79094    3.17033    17.81165   1  2  B  ASN  1  1
-    #ATOM   2659  N  ND2   . ASN  43   43   ?  B  11.77101   2.23791    17.39764   1  2  B  ASN  1  1
-    #HETATM 2660  P  PG    . ATP  .    1    ?  C  -8.79525   6.04621    -4.99212   1  3  C  ATP  1  1
-    #HETATM 2661  O  O1G   . ATP  .    1    ?  C  -10.01901  6.83468    -5.24825   1  3  C  ATP  1  1
-    #HETATM 2662  O  O2G   . ATP  .    1    ?  C  -9.03047   4.56941    -4.85246   1  3  C  ATP  1  1
-    #HETATM 2663  O  O3G   . ATP  .    1    ?  C  -7.97335   6.60305    -3.86656   1  3  C  ATP  1  1
-    #HETATM 2664  P  PB    . ATP  .    1    ?  C  -6.63618   7.04315    -6.56073   1  3  C  ATP  1  1
-    #HETATM 2665  O  O1B   . ATP  .    1    ?  C  -7.04640   8.36577    -7.14326   1  3  C  ATP  1  1
-    #HETATM 2666  O  O2B   . ATP  .    1    ?  C  -5.79036   7.13926    -5.33995   1  3  C  ATP  1  1
-
-
-    linelist =        line.split()
-    atom_num =        linelist[ fielddict['id'] ]
-    atom_name =       linelist[ fielddict['label_atom_id'] ]
-    residue_name =    linelist[ fielddict['label_comp_id'] ]
-    if "auth_asym_id" in fielddict:
-        chain_id =    linelist[ fielddict['auth_asym_id'] ]
-    else:
-        chain_id =    linelist[ fielddict['label_asym_id'] ]
-
-    residue_seq_num = linelist[ fielddict['label_seq_id'] ]
-    x =               linelist[ fielddict['Cartn_x'] ]
-    y =               linelist[ fielddict['Cartn_y'] ]
-    z =               linelist[ fielddict['Cartn_z'] ]
-
-    if residue_seq_num == ".": return None   # ligand atom
-
-    # Convert string numbers to integers or floats as appropriate
-    atom_num = int(atom_num)
-    residue_seq_num = int(residue_seq_num)
-    x = float(x)
-    y = float(y)
-    z = float(z)
-
-    return {
-        'atom_num': atom_num,
-        'atom_name': atom_name,
-        'residue_name': residue_name,
-        'chain_id': chain_id,
-        'residue_seq_num': residue_seq_num,
-        'x': x,
-        'y': y,
-        'z': z
-    }
-
+# Mean of each row of values over the columns selected by mask; rows with no selected columns are 0.0
+def masked_row_mean(values, mask):
+    if mask is True:
+        return values.mean(axis=1)
+    mask = np.broadcast_to(mask, values.shape)
+    counts = mask.sum(axis=1)
+    sums = np.where(mask, values, 0.0).sum(axis=1)
+    return np.divide(sums, counts, out=np.zeros(len(sums)), where=counts > 0)
+
+# Whole-array ipSAE kernel for the chain1 rows of one ordered chain pair (no per-residue loop)
+#   pae_rows:        PAE values, one row per residue of chain1
+#   ptm_rows_d0chn:  ptm_func(pae_rows, d0chn); the row means over all chain2 residues are ipTM_d0chn
+#   valid_rows:      columns scored for ipSAE (chain2 residues with PAE < cutoff)
+#   d0res_rows:      d0 for each row from the number of valid chain2 residues (n0res)
+# returns by-residue ipsae_d0chn, ipsae_d0dom, ipsae_d0res for the rows
+def ipsae_kernel(pae_rows, ptm_rows_d0chn, valid_rows, d0dom, d0res_rows):
+    ipsae_d0chn = masked_row_mean(ptm_rows_d0chn, valid_rows)
+    ipsae_d0dom = masked_row_mean(ptm_func(pae_rows, d0dom), valid_rows)
+    ipsae_d0res = masked_row_mean(ptm_func(pae_rows, d0res_rows[:, np.newaxis]), valid_rows)
+    return ipsae_d0chn, ipsae_d0dom, ipsae_d0res
 
 
 # Function for printing out residue numbers in PyMOL scripts
@@ -303,45 +159,127 @@ def init_chainpairdict_zeros(chainlist):
 def init_chainpairdict_npzeros(chainlist, arraysize):
     return {chain1: {chain2: np.zeros(arraysize) for chain2 in chainlist if chain1 != chain2} for chain1 in chainlist}
 
-# Initializes a nested dictionary with empty sets.
-def init_chainpairdict_set(chainlist):
-    return {chain1: {chain2: set() for chain2 in chainlist if chain1 != chain2} for chain1 in chainlist}
-
-
-def classify_chains(chains, residue_types):
-    nuc_residue_set = {"DA", "DC", "DT", "DG", "A", "C", "U", "G"}
-    chain_types = {}
-
-    # Get unique chains and iterate over them
-    _, first_idx = np.unique(chains, return_index=True)
-    unique_chains = chains[np.sort(first_idx)]
-
-    for chain in unique_chains:
-        # Find indices where the current chain is located
-        indices = np.where(chains == chain)[0]
-        # Get the residues for these indices
-        chain_residues = residue_types[indices]
-        # Count nucleic acid residues
-        nuc_count = sum(residue in nuc_residue_set for residue in chain_residues)
-
-        # Determine if the chain is a nucleic acid or protein
-        chain_types[chain] = 'nucleic_acid' if nuc_count > 0 else 'protein'
-
-    return chain_types
+# Initializes a nested dictionary with all-False boolean masks over the residues of chain1 (or of chain2 with second=True)
+def init_chainpairdict_masks(layout, second=False):
+    return {chain1: {chain2: np.zeros(layout.lengths[chain2 if second else chain1], dtype=bool)
+                     for chain2 in layout.chains if chain1 != chain2} for chain1 in layout.chains}
+
+
+# Chain layout of one model, built once from the per-residue chain ids: for each chain (in order of first appearance)
+# an integer id, its residue indices, its length and, when its residues are contiguous, a slice.
+# codes holds the integer chain id of every residue, so no string comparisons are needed after construction.
+# rows(chain) is the slice when there is one (per-residue arrays and PAE blocks are then views) or the index array.
+class ChainLayout:
+    def __init__(self, chains):
+        chains = np.asarray(chains)
+        labels, first_idx, inverse = np.unique(chains, return_index=True, return_inverse=True)
+        appearance = np.argsort(first_idx, kind='stable')
+        rank = np.empty(len(labels), dtype=np.int64)
+        rank[appearance] = np.arange(len(labels))
+
+        self.chains =  labels[appearance]
+        self.nchains = len(self.chains)
+        self.codes =   rank[inverse.reshape(-1)]
+        self.ids =     {chain: nchain for nchain, chain in enumerate(self.chains)}
+
+        # residues grouped by chain: chain n occupies order[starts[n]:starts[n]+lengths[n]]
+        self.order =   np.argsort(self.codes, kind='stable')
+        lengths =      np.bincount(self.codes, minlength=self.nchains)
+        self.starts =  np.cumsum(lengths) - lengths
+        self.contiguous = bool(np.array_equal(self.order, np.arange(len(chains))))
+
+        # position of every residue within its chain (index into per-chain masks)
+        self.positions = np.empty(len(chains), dtype=np.int64)
+        self.positions[self.order] = np.arange(len(chains)) - np.repeat(self.starts, lengths)
+
+        self.lengths = {}
+        self.indices = {}
+        self.slices =  {}
+        for nchain, chain in enumerate(self.chains):
+            indices = self.order[self.starts[nchain]:self.starts[nchain] + lengths[nchain]]
+            self.lengths[chain] = int(lengths[nchain])
+            self.indices[chain] = indices
+            self.slices[chain] = slice(int(indices[0]), int(indices[-1]) + 1) if indices[-1] - indices[0] + 1 == len(indices) else None
+
+    # residues of chain (optionally only the tile of its residues given by a slice) as a slice or an index array
+    def rows(self, chain, tile=slice(None)):
+        chain_slice = self.slices[chain]
+        if chain_slice is None:
+            return self.indices[chain][tile]
+        start, stop, _ = tile.indices(self.lengths[chain])
+        return slice(chain_slice.start + start, chain_slice.start + stop)
+
+    # chain1 x chain2 block of a numres x numres matrix: a view when both chains are contiguous, otherwise a copy
+    def block(self, matrix, chain1, chain2, tile=slice(None)):
+        rows = self.rows(chain1, tile)
+        cols = self.rows(chain2)
+        if isinstance(rows, slice) and isinstance(cols, slice):
+            return matrix[rows, cols]
+        return matrix[np.ix_(self.indices[chain1][tile], self.indices[chain2])]
+
+
+def classify_chains(layout, residue_types):
+    # Count nucleic acid residues in each chain
+    is_nuc = np.isin(residue_types, list(nuc_residue_set))
+    nuc_count = np.bincount(layout.codes, weights=is_nuc, minlength=layout.nchains)
+
+    # Determine if the chain is a nucleic acid or protein
+    return {chain: 'nucleic_acid' if nuc_count[nchain] > 0 else 'protein' for nchain, chain in enumerate(layout.chains)}
+
+
+# Cell-list neighbor search for interchain contacts.
+# Coordinates are binned into cubic cells with edge = cutoff, so any pair within cutoff lies in the same or an
+# adjacent cell; only those candidate pairs are ever materialized. Returns (i, j, d) for every ordered pair of
+# residues in different chains with d <= cutoff, sorted by i and then j. Memory scales with the number of
+# contacts (and near-contacts), not numres^2.
+def find_interchain_contacts(coordinates, chain_codes, cutoff):
+    numres = len(coordinates)
+    if numres == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    cells = np.floor((coordinates - coordinates.min(axis=0)) / cutoff).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+    cell_ids = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(cell_ids, kind='stable')
+    sorted_cell_ids = cell_ids[order]
+
+    contact_i = []
+    contact_j = []
+    contact_d = []
+    for offset in np.ndindex(3, 3, 3):
+        neighbor_cells = cells + (np.array(offset) - 1)
+        inside = np.all((neighbor_cells >= 0) & (neighbor_cells < dims), axis=1)
+        neighbor_ids = (neighbor_cells[:, 0] * dims[1] + neighbor_cells[:, 1]) * dims[2] + neighbor_cells[:, 2]
+        start = np.searchsorted(sorted_cell_ids, neighbor_ids, side='left')
+        counts = np.where(inside, np.searchsorted(sorted_cell_ids, neighbor_ids, side='right') - start, 0)
+        if counts.sum() == 0:
+            continue
 
+        # expand each residue i into the members j of its neighbor cell
+        i = np.repeat(np.arange(numres), counts)
+        position_in_cell = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(start, counts) + position_in_cell]
+
+        interchain = chain_codes[i] != chain_codes[j]
+        i = i[interchain]
+        j = j[interchain]
+        d = np.sqrt(((coordinates[i] - coordinates[j])**2).sum(axis=1))
+        close = d <= cutoff
+        contact_i.append(i[close])
+        contact_j.append(j[close])
+        contact_d.append(d[close])
+
+    if not contact_i:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    contact_i = np.concatenate(contact_i)
+    contact_j = np.concatenate(contact_j)
+    contact_d = np.concatenate(contact_d)
+    order = np.lexsort((contact_j, contact_i))
+    return contact_i[order], contact_j[order], contact_d[order]
 
-# Load residues from AlphaFold PDB or mmCIF file into lists; each residue is a dictionary
-# Read PDB file to get CA coordinates, chainids, and residue numbers
-# Convert to np arrays, and calculate distances
-residues = []
-cb_residues = []
-chains = []
-atomsitefield_num=0
-atomsitefield_dict={} # contains order of atom_site fields in mmCIF files; handles any mmCIF field order
 
 # For af3 and boltz: need mask to identify CA atom tokens in plddt vector and pae matrix;
 # Skip ligand atom tokens and non-CA-atom tokens in PTMs (those not in residue_set)
-token_mask=list()
 residue_set= {"ALA", "ARG", "ASN", "ASP", "CYS",
               "GLN", "GLU", "GLY", "HIS", "ILE",
               "LEU", "LYS", "MET", "PHE", "PRO",
@@ -350,118 +288,375 @@ residue_set= {"ALA", "ARG", "ASN", "ASP", "CYS",
 
 nuc_residue_set = {"DA", "DC", "DT", "DG", "A", "C", "U", "G"}
 
-with open(pdb_path, 'r') as PDB:
-    for line in PDB:
+# arbitrarily setting d0 to 2.0 for NA/protein or NA/NA chain pairs (approximately 21 base pairs)
+d0_nucleic_acid=2.0
+pDockQ_cutoff=8.0
 
-        if line.startswith("_atom_site."):
-            line=line.strip()
-            (atomsite,fieldname)=line.split(".")
-            atomsitefield_dict[fieldname]=atomsitefield_num
-            atomsitefield_num += 1
-            continue
-        
-        if line.startswith("ATOM") or line.startswith("HETATM"):
-            if cif:
-                atom=parse_cif_atom_line(line, atomsitefield_dict)
-            else:
-                atom=parse_pdb_atom_line(line)
-            if atom is None:  # ligand atom
-                token_mask.append(0)
-                continue
+chaincolor={'A':'magenta',   'B':'marine',   'C':'lime',        'D':'orange',
+            'E':'yellow',    'F':'cyan',     'G':'lightorange', 'H':'pink',
+            'I':'deepteal',  'J':'forest',   'K':'lightblue',   'L':'slate',
+            'M':'violet',    'N':'arsenic',  'O':'iodine',      'P':'silver',
+            'Q':'red',       'R':'sulfur',   'S':'purple',      'T':'olive',
+            'U':'palegreen', 'V':'green',    'W':'blue',        'X':'palecyan',
+            'Y':'limon',     'Z':'chocolate'}
 
-            if atom['atom_name'] == "CA" or "C1" in atom['atom_name']:
-                token_mask.append(1)
-                residues.append({
-                    'atom_num': atom['atom_num'],
-                    'coor': np.array([atom['x'], atom['y'], atom['z']]),
-                    'res': atom['residue_name'],
-                    'chainid': atom['chain_id'],
-                    'resnum': atom['residue_seq_num'],
-                    'residue': f"{atom['residue_name']:3}   {atom['chain_id']:3} {atom['residue_seq_num']:4}"
-                })
-                chains.append(atom['chain_id'])
-
-            if atom['atom_name'] == "CB" or "C3" in atom['atom_name'] or (atom['residue_name']=="GLY" and atom['atom_name']=="CA"):
-                cb_residues.append({
-                    'atom_num': atom['atom_num'],
-                    'coor': np.array([atom['x'], atom['y'], atom['z']]),
-                    'res': atom['residue_name'],
-                    'chainid': atom['chain_id'],
-                    'resnum': atom['residue_seq_num'],
-                    'residue': f"{atom['residue_name']:3}   {atom['chain_id']:3} {atom['residue_seq_num']:4}"
-                })
 
-            # add nucleic acids and non-CA atoms in PTM residues to tokens (as 0), whether labeled as "HETATM" (af3) or as "ATOM" (boltz)
-            if atom['atom_name'] != "CA" and "C1" not in atom['atom_name'] and atom['residue_name'] not in residue_set:
-                token_mask.append(0)
+# Identify the model type from the file names:  returns (model_type, cif) with model_type in 'af2', 'af3', 'boltz'
+def model_type_from_paths(pae_file_path, pdb_path):
+    if ".pdb" in pdb_path and pae_file_path.endswith(".json"):
+        return 'af2', False
+    elif ".cif" in pdb_path and pae_file_path.endswith(".json"):
+        return 'af3', True
+    elif ".cif" in pdb_path and pae_file_path.endswith(".npz"):  # Boltz1/2 in cif format
+        return 'boltz', True
+    elif ".pdb" in pdb_path and pae_file_path.endswith(".npz"):  # Boltz1/2 in pdb format
+        return 'boltz', False
+    raise ValueError(f"Wrong PDB or PAE file type  {pdb_path}")
+
+
+# Output file names:  pdb_stem is the model name written in the Model column; path_stem includes the cutoffs
+def output_stems(pdb_path, pae_cutoff, dist_cutoff):
+    pae_string, dist_string = cutoff_strings(pae_cutoff, dist_cutoff)
+    if ".pdb" in pdb_path:
+        pdb_stem=pdb_path.replace(".pdb","")
+    else:
+        pdb_stem=pdb_path.replace(".cif","")
+    path_stem = f'{pdb_stem}_{pae_string}_{dist_string}'
+    return pdb_stem, path_stem
+
+def cutoff_strings(pae_cutoff, dist_cutoff):
+    pae_string =       str(int(pae_cutoff))
+    if pae_cutoff<10:  pae_string="0"+pae_string
+    dist_string =      str(int(dist_cutoff))
+    if dist_cutoff<10: dist_string="0"+dist_string
+    return pae_string, dist_string
+
+
+# Structure information for one model, one entry per token (CA atom, or C1' for nucleic acids):
+# chains, residue types and numbers, CA/CB atom numbers, CB (or C3'; CA for GLY) coordinates, and the token mask
+class Structure:
+    def __init__(self, CA_atom_num, residue_types, chains, resnums, CB_atom_num, coordinates, token_mask, cif=True):
+        self.cif =           cif
+        self.numres =        len(chains)
+        self.CA_atom_num =   np.asarray(CA_atom_num)-1  # for AF3 atom indexing from 0
+        self.CB_atom_num =   np.asarray(CB_atom_num)-1  # for AF3 atom indexing from 0
+        self.coordinates =   np.asarray(coordinates, dtype=float).reshape(-1, 3)
+        self.chains =        np.asarray(chains)
+
+        self.layout =        ChainLayout(self.chains)
+        self.unique_chains = self.layout.chains
+        self.chain_indices = self.layout.indices
+        self.token_array =   np.asarray(token_mask, dtype=int)
+        self.ntokens =       np.sum(self.token_array)
+        self.residue_types = np.asarray(residue_types)
+        self.resnums =       np.asarray(resnums, dtype=int)
+
+        # chains whose residue numbers are all distinct (interface residue counts are then plain mask counts)
+        self.distinct_resnums = {chain: len(np.unique(self.resnums[self.layout.rows(chain)])) == self.layout.lengths[chain]
+                                 for chain in self.unique_chains}
+
+        # chain types (nucleic acid (NA) or protein) and chain_pair_types ('nucleic_acid' if either chain is NA) for d0 calculation
+        self.chain_dict = classify_chains(self.layout, self.residue_types)
+        self.chain_pair_type = init_chainpairdict_zeros(self.unique_chains)
+        for chain1 in self.unique_chains:
+            for chain2 in self.unique_chains:
+                if chain1==chain2: continue
+                if self.chain_dict[chain1] == 'nucleic_acid' or self.chain_dict[chain2] == 'nucleic_acid':
+                    self.chain_pair_type[chain1][chain2]='nucleic_acid'
+                else:
+                    self.chain_pair_type[chain1][chain2]='protein'
+
+    # distinct residue numbers of the residues of chain selected by a boolean mask over that chain, and their number
+    def residue_numbers(self, chain, mask):
+        return np.unique(self.resnums[self.layout.rows(chain)][mask])
+
+    def count_residues(self, chain, mask):
+        if self.distinct_resnums[chain]:
+            return int(np.count_nonzero(mask))
+        return len(self.residue_numbers(chain, mask))
+
+    # residue label used to identify the residue that provides each asym/max value, e.g. "ARG   A    159"
+    def residue_label(self, i):
+        return f"{self.residue_types[i]:3}   {self.chains[i]:3} {self.resnums[i]:4}"
+
+
+# Sparse interchain contacts of one model within the largest distance cutoff needed (pDockQ_cutoff or dist_cutoff).
+# i, j, d are parallel arrays (both orderings of every pair are present); pair_index[chain1][chain2] holds the
+# positions in those arrays of the contacts with i in chain1 and j in chain2.
+class ContactList:
+    def __init__(self, structure, cutoff):
+        self.cutoff = cutoff
+        layout = structure.layout
+        self.i, self.j, self.d = find_interchain_contacts(structure.coordinates, layout.codes, cutoff)
+
+        # integer code of the ordered chain pair of each contact: n(chain_i) * nchains + n(chain_j)
+        unique_chains = layout.chains
+        self.nchains = layout.nchains
+        chain_codes = layout.codes
+        self.pair_code = chain_codes[self.i] * self.nchains + chain_codes[self.j]
+
+        order = np.argsort(self.pair_code, kind='stable')
+        bounds = np.searchsorted(self.pair_code[order], np.arange(self.nchains**2 + 1))
+        self.pair_index = {chain1: {} for chain1 in unique_chains}
+        for nchain1, chain1 in enumerate(unique_chains):
+            for nchain2, chain2 in enumerate(unique_chains):
+                if chain1 == chain2: continue
+                code = nchain1 * self.nchains + nchain2
+                self.pair_index[chain1][chain2] = order[bounds[code]:bounds[code + 1]]
 
-# Convert structure information to numpy arrays
-numres = len(residues)
-CA_atom_num=  np.array([res['atom_num']-1 for res in residues])  # for AF3 atom indexing from 0
-CB_atom_num=  np.array([res['atom_num']-1 for res in cb_residues])  # for AF3 atom indexing from 0
-coordinates = np.array([res['coor']       for res in cb_residues])
-chains = np.array(chains)
+    # contacts of chain1 -> chain2 with distance <= max_dist (or < max_dist when inclusive is False)
+    def pair(self, chain1, chain2, max_dist, inclusive=True):
+        index = self.pair_index[chain1][chain2]
+        d = self.d[index]
+        index = index[d <= max_dist] if inclusive else index[d < max_dist]
+        return self.i[index], self.j[index]
 
-_, first_idx = np.unique(chains, return_index=True)
-unique_chains = chains[np.sort(first_idx)]
-token_array=np.array(token_mask)
-ntokens=np.sum(token_array)
-residue_types=np.array([res['res'] for res in residues])
 
-# chain types (nucleic acid (NA) or protein) and chain_pair_types ('nucleic_acid' if either chain is NA) for d0 calculation
-# arbitrarily setting d0 to 2.0 for NA/protein or NA/NA chain pairs (approximately 21 base pairs)
-d0_nucleic_acid=2.0
-chain_dict = classify_chains(chains, residue_types)
-chain_pair_type = init_chainpairdict_zeros(unique_chains)
-for chain1 in unique_chains:
-    for chain2 in unique_chains:
-        if chain1==chain2: continue
-        if chain_dict[chain1] == 'nucleic_acid' or chain_dict[chain2] == 'nucleic_acid':
-            chain_pair_type[chain1][chain2]='nucleic_acid'
-        else:
-            chain_pair_type[chain1][chain2]='protein'
+# Load residues from AlphaFold PDB or mmCIF file
+# Read PDB file to get CA coordinates, chainids, and residue numbers
+# The atom records are read in bulk into column arrays (one entry per atom) and the tokens are selected with
+# vectorized masks; no per-atom dictionaries or coordinate arrays are built.
+def read_structure(pdb_path, cif=None):
+    if cif is None:
+        cif = ".cif" in pdb_path
+    if cif:
+        atoms = read_cif_atom_columns(pdb_path)
+    else:
+        atoms = read_pdb_atom_columns(pdb_path)
+    return structure_from_atom_columns(atoms, cif)
+
+
+# Column arrays for the _atom_site loop of an mmCIF file (AF3 and Boltz1/2).
+# The header lines give the order of the _atom_site fields (any mmCIF field order is handled); the
+# ATOM/HETATM records are tokenized in one split and only the needed columns are converted.
+# ligands do not have residue numbers but modified residues do: label_seq_id is "." for ligand atoms.
+# AF3 mmcif lines
+# 0      1   2   3     4  5  6 7  8  9  10      11     12      13   14    15 16 17
+#ATOM   1294 N   N     . ARG A 1 159 ? 5.141   -14.096 10.526  1.00 95.62 159 A 1
+#ATOM   1295 C   CA    . ARG A 1 159 ? 4.186   -13.376 11.366  1.00 96.27 159 A 1
+#ATOM   1296 C   C     . ARG A 1 159 ? 2.976   -14.235 11.697  1.00 96.42 159 A 1
+#ATOM   1297 O   O     . ARG A 1 159 ? 2.654   -15.174 10.969  1.00 95.46 159 A 1
+# ...
+#HETATM 1305 N   N     . TPO A 1 160 ? 2.328   -13.853 12.742  1.00 96.42 160 A 1
+#HETATM 1306 C   CA    . TPO A 1 160 ? 1.081   -14.560 13.218  1.00 96.78 160 A 1
+#HETATM 1307 C   C     . TPO A 1 160 ? -2.115  -11.668 12.263  1.00 96.19 160 A 1
+#HETATM 1308 O   O     . TPO A 1 160 ? -1.790  -11.556 11.113  1.00 95.75 160 A 1
+# ...
+#HETATM 2608 P   PG    . ATP C 3 .   ? -6.858  4.182   10.275  1.00 84.94 1   C 1
+#HETATM 2609 O   O1G   . ATP C 3 .   ? -6.178  5.238   11.074  1.00 75.56 1   C 1
+#HETATM 2610 O   O2G   . ATP C 3 .   ? -5.889  3.166   9.748   1.00 75.15 1   C 1
+# ...
+#HETATM 2639 MG  MG    . MG  D 4 .   ? -7.262  2.709   4.825   1.00 91.47 1   D 1
+#HETATM 2640 MG  MG    . MG  E 5 .   ? -4.994  2.251   8.755   1.00 85.96 1   E 1
+
+
+# Boltz1 mmcif files (in non-standard order))
+#_atom_site.group_PDB
+#_atom_site.id
+#_atom_site.type_symbol
+#_atom_site.label_atom_id
+#_atom_site.label_alt_id
+#_atom_site.label_comp_id
+#_atom_site.label_seq_id
+#_atom_site.auth_seq_id
+#_atom_site.pdbx_PDB_ins_code
+#_atom_site.label_asym_id
+#_atom_site.Cartn_x
+#_atom_site.Cartn_y
+#_atom_site.Cartn_z
+#_atom_site.occupancy
+#_atom_site.label_entity_id
+#_atom_site.auth_asym_id
+#_atom_site.auth_comp_id
+#_atom_site.B_iso_or_equiv
+#_atom_site.pdbx_PDB_model_num
+# 0     1     2  3     4   5   6    7   8  9  10          11         12       13  14 15 16  17 18
+#ATOM   2652  N  N     . ASN  43   43   ?  B  10.83538   6.06359    18.45139   1  2  B  ASN  1  1
+#ATOM   2653  C  CA    . ASN  43   43   ?  B  10.76295   5.07366    19.53232   1  2  B  ASN  1  1
+#ATOM   2654  C  C     . ASN  43   43   ?  B  11.21770   5.64437    20.88774   1  2  B  ASN  1  1
+#ATOM   2655  O  O     . ASN  43   43   ?  B  12.06730   6.51688    20.91168   1  2  B  ASN  1  1
+#ATOM   2656  C  CB    . ASN  43   43   ?  B  11.60137   3.84778    19.19481   1  2  B  ASN  1  1
+#ATOM   2657  C  CG    . ASN  43   43   ?  B  10.96208   3.03997    18.07013   1  2  B  ASN  1  1
+#ATOM   2658  O  OD1   . ASN  43   43   ?  B  9.79094    3.17033    17.81165   1  2  B  ASN  1  1
+#ATOM   2659  N  ND2   . ASN  43   43   ?  B  11.77101   2.23791    17.39764   1  2  B  ASN  1  1
+#HETATM 2660  P  PG    . ATP  .    1    ?  C  -8.79525   6.04621    -4.99212   1  3  C  ATP  1  1
+#HETATM 2661  O  O1G   . ATP  .    1    ?  C  -10.01901  6.83468    -5.24825   1  3  C  ATP  1  1
+#HETATM 2662  O  O2G   . ATP  .    1    ?  C  -9.03047   4.56941    -4.85246   1  3  C  ATP  1  1
+#HETATM 2663  O  O3G   . ATP  .    1    ?  C  -7.97335   6.60305    -3.86656   1  3  C  ATP  1  1
+#HETATM 2664  P  PB    . ATP  .    1    ?  C  -6.63618   7.04315    -6.56073   1  3  C  ATP  1  1
+#HETATM 2665  O  O1B   . ATP  .    1    ?  C  -7.04640   8.36577    -7.14326   1  3  C  ATP  1  1
+#HETATM 2666  O  O2B   . ATP  .    1    ?  C  -5.79036   7.13926    -5.33995   1  3  C  ATP  1  1
+def read_cif_atom_columns(pdb_path):
+    atomsitefield_num=0
+    atomsitefield_dict={} # contains order of atom_site fields in mmCIF files; handles any mmCIF field order
+    atom_lines=[]
+    with open(pdb_path, 'r') as PDB:
+        for line in PDB:
+            if line.startswith("_atom_site."):
+                line=line.strip()
+                (atomsite,fieldname)=line.split(".")
+                atomsitefield_dict[fieldname]=atomsitefield_num
+                atomsitefield_num += 1
+            elif line.startswith(("ATOM", "HETATM")):
+                atom_lines.append(line)
+
+    nfields = len(atomsitefield_dict)
+    tokens = " ".join(atom_lines).split()
+    if len(tokens) == len(atom_lines) * nfields:
+        def column(fieldname):
+            return tokens[atomsitefield_dict[fieldname]::nfields]
+    else:
+        # records with missing or extra fields: split line by line
+        linelists = [line.split() for line in atom_lines]
+        def column(fieldname):
+            return [linelist[atomsitefield_dict[fieldname]] for linelist in linelists]
 
-# Calculate distance matrix using NumPy broadcasting
-distances = np.sqrt(((coordinates[:, np.newaxis, :] - coordinates[np.newaxis, :, :])**2).sum(axis=2))
+    if "auth_asym_id" in atomsitefield_dict:
+        chain_id = np.array(column('auth_asym_id'))
+    else:
+        chain_id = np.array(column('label_asym_id'))
+    residue_seq_num = np.array(column('label_seq_id'))
+    ligand = residue_seq_num == "."   # ligand atom
+    residue_seq_num[ligand] = "0"
 
-# Load AF2, AF3, or BOLTZ data and extract plddt and pae_matrix (and ptm_matrix if available)
-if af2:
+    return {
+        'atom_num':        np.array(column('id'), dtype=int),
+        'atom_name':       np.array(column('label_atom_id')),
+        'residue_name':    np.array(column('label_comp_id')),
+        'chain_id':        chain_id,
+        'residue_seq_num': residue_seq_num.astype(int),
+        'coor':            np.column_stack([np.array(column(field), dtype=float) for field in ('Cartn_x', 'Cartn_y', 'Cartn_z')]).reshape(-1, 3),
+        'ligand':          ligand,
+    }
 
-    if os.path.exists(pae_file_path):
-        if pae_file_path.endswith('.pkl'):
-            data = np.load(pae_file_path, allow_pickle=True)
-        else:
-            with open(pae_file_path, 'r') as file:
-                data = json.load(file)
 
-        if 'iptm' in data: iptm_af2 =   float(data['iptm'])
-        else: iptm_af2=-1.0
-        if 'ptm' in data: ptm_af2  =   float(data['ptm'])
-        else: ptm_af2=-1.0
+# Column arrays for the ATOM/HETATM records of a PDB file (by column)
+# line = "ATOM    123  CA  ALA A  15     11.111  22.222  33.333  1.00 20.00           C"
+def read_pdb_atom_columns(pdb_path):
+    with open(pdb_path, 'r') as PDB:
+        atom_lines = [line for line in PDB if line.startswith(("ATOM", "HETATM"))]
+
+    def column(start, end):
+        return np.char.strip(np.array([line[start:end] for line in atom_lines], dtype=str))
+
+    residue_name = column(17, 20)
+    ligand = residue_name == "LIG"  # ligands in Boltz PDB-format files
+    residue_seq_num = column(22, 26)
+    residue_seq_num[ligand] = "0"
+
+    return {
+        'atom_num':        column(6, 11).astype(int),
+        'atom_name':       column(12, 16),
+        'residue_name':    residue_name,
+        'chain_id':        column(21, 22),
+        'residue_seq_num': residue_seq_num.astype(int),
+        'coor':            np.column_stack([column(30, 38).astype(float), column(38, 46).astype(float), column(46, 54).astype(float)]).reshape(-1, 3),
+        'ligand':          ligand,
+    }
+
 
-        if 'plddt' in data:
-            plddt =      np.array(data['plddt'])
-            cb_plddt =   np.array(data['plddt'])  # for pDockQ
+# Select the tokens of a structure from its atom columns with vectorized masks.
+# For af3 and boltz: need mask to identify CA atom tokens in plddt vector and pae matrix;
+# Skip ligand atom tokens and non-CA-atom tokens in PTMs (those not in residue_set)
+def structure_from_atom_columns(atoms, cif=True):
+    atom_name =    atoms['atom_name']
+    residue_name = atoms['residue_name']
+    ligand =       atoms['ligand']
+
+    has_C1 = np.char.find(atom_name, "C1") >= 0
+    has_C3 = np.char.find(atom_name, "C3") >= 0
+    ca_token = ~ligand & ((atom_name == "CA") | has_C1)
+    cb_atom =  ~ligand & ((atom_name == "CB") | has_C3 | ((residue_name == "GLY") & (atom_name == "CA")))
+
+    # token_mask: 0 for each ligand atom, 1 for each CA (C1') atom, and 0 for the other atoms of nucleic acids and
+    # PTM residues (not in residue_set), whether labeled as "HETATM" (af3) or as "ATOM" (boltz)
+    nonstandard_atom = ~ligand & ~ca_token & ~np.isin(residue_name, list(residue_set))
+    token_mask = ca_token[ligand | ca_token | nonstandard_atom].astype(int)
+
+    return Structure(atoms['atom_num'][ca_token],
+                     residue_name[ca_token],
+                     atoms['chain_id'][ca_token],
+                     atoms['residue_seq_num'][ca_token],
+                     atoms['atom_num'][cb_atom],
+                     atoms['coor'][cb_atom],
+                     token_mask,
+                     cif)
+
+
+# PAE matrix, pLDDTs and chain-pair ipTM values read from the AF2/AF3/Boltz confidence files.
+# iptm_af[chain1][chain2] holds the ipTM reported by the structure predictor (same value for all pairs for AF2)
+class PAEData:
+    def __init__(self, pae_matrix, plddt, cb_plddt, iptm_af, model_type, token_chain_ids=None):
+        self.pae_matrix = pae_matrix
+        self.plddt =      plddt
+        self.cb_plddt =   cb_plddt
+        self.iptm_af =    iptm_af
+        self.model_type = model_type
+        self.token_chain_ids = token_chain_ids
+
+
+# Load AF2, AF3, or BOLTZ data and extract plddt and pae_matrix (and ptm_matrix if available)
+# float32=True keeps the PAE matrix in float32 (half the memory of the default float64)
+def load_pae(pae_file_path, structure, model_type=None, float32=False):
+    if model_type is None:
+        if pae_file_path.endswith(".npz"):
+            model_type = 'boltz'
         else:
-            plddt = np.zeros(numres)
-            cb_plddt = np.zeros(numres)
+            model_type = 'af3' if structure.cif else 'af2'
+    if model_type == 'af2':
+        pae = load_af2_pae(pae_file_path, structure)
+    elif model_type == 'boltz':
+        pae = load_boltz_pae(pae_file_path, structure)
+    else:
+        pae = load_af3_pae(pae_file_path, structure, dtype=np.float32 if float32 else np.float64)
+    if float32:
+        pae.pae_matrix = pae.pae_matrix.astype(np.float32, copy=False)
+    return pae
+
+def load_af2_pae(pae_file_path, structure):
+    numres = structure.numres
+    unique_chains = structure.unique_chains
 
-        if 'pae' in data:
-            pae_matrix = np.array(data['pae'])
-        elif 'predicted_aligned_error' in data:
-            pae_matrix=np.array(data['predicted_aligned_error'])
+    if not os.path.exists(pae_file_path):
+        raise FileNotFoundError(f"AF2 PAE file does not exist:  {pae_file_path}")
 
+    if pae_file_path.endswith('.pkl'):
+        data = np.load(pae_file_path, allow_pickle=True)
     else:
-        print("AF2 PAE file does not exist: ", pae_file_path)
-        sys.exit()
+        with open(pae_file_path, 'r') as file:
+            data = json.load(file)
+
+    if 'iptm' in data: iptm_af2 =   float(data['iptm'])
+    else: iptm_af2=-1.0
+    if 'ptm' in data: ptm_af2  =   float(data['ptm'])
+    else: ptm_af2=-1.0
+
+    if 'plddt' in data:
+        plddt =      np.array(data['plddt'])
+        cb_plddt =   np.array(data['plddt'])  # for pDockQ
+    else:
+        plddt = np.zeros(numres)
+        cb_plddt = np.zeros(numres)
+
+    if 'pae' in data:
+        pae_matrix = np.array(data['pae'])
+    elif 'predicted_aligned_error' in data:
+        pae_matrix=np.array(data['predicted_aligned_error'])
+    else:
+        raise ValueError(f"no PAE data in AF2 json file {pae_file_path}")
+
+    iptm_af2 = {chain1: {chain2: iptm_af2 for chain2 in unique_chains if chain1 != chain2} for chain1 in unique_chains}  # same for all chain pairs in entry
+    return PAEData(pae_matrix, plddt, cb_plddt, iptm_af2, 'af2')
 
-if boltz:
+def load_boltz_pae(pae_file_path, structure):
     # Boltz filenames:
     # AURKA_TPX2_model_0.cif
     # confidence_AURKA_TPX2_model_0.json
     # pae_AURKA_TPX2_model_0.npz
     # plddt_AURKA_TPX2_model_0.npz
-
+    token_array = structure.token_array
+    ntokens = structure.ntokens
+    unique_chains = structure.unique_chains
 
     plddt_file_path=pae_file_path.replace("pae","plddt")
     if os.path.exists(plddt_file_path):
@@ -486,8 +681,7 @@ if boltz:
         pae_matrix = pae_matrix_boltz[np.ix_(token_array.astype(bool), token_array.astype(bool))]
 
     else:
-        print("Boltz PAE file does not exist: ", pae_file_path)
-        sys.exit()
+        raise FileNotFoundError(f"Boltz PAE file does not exist:  {pae_file_path}")
 
     summary_file_path=pae_file_path.replace("pae","confidence")
     summary_file_path=summary_file_path.replace(".npz",".json")
@@ -503,7 +697,7 @@ if boltz:
                 print(f"Warning: 'pair_chains_iptm' key not found in {summary_file_path}. ipTM scores will be 0.")
                 boltz_chain_pair_iptm_data = {}
 
-            
+
             boltz_chain_pair_iptm_data=data_summary['pair_chains_iptm']
             for nchain1, chain1 in enumerate(unique_chains):
                 for nchain2, chain2 in enumerate(unique_chains):
@@ -512,7 +706,101 @@ if boltz:
     else:
         print("Boltz summary file does not exist: ", summary_file_path)
 
-if af3:
+    return PAEData(pae_matrix, plddt, cb_plddt, iptm_boltz, 'boltz')
+
+# Streaming reader for AF3 full_data / confidences json files.
+# json.load builds a Python float object for each of the N^2 PAE values before np.array copies them again,
+# which costs many times the memory of the final array.  Here the file is memory-mapped, the value of each
+# key is located in the raw text, and the numbers are parsed straight into typed arrays with np.fromstring.
+# The PAE matrix is parsed in blocks of whole rows and the token mask is applied to each block as it is read,
+# so the full token x token matrix is never held in memory.
+# Returns None if the file does not have the expected layout; callers then fall back to json.load.
+af3_read_block_bytes = 1 << 24
+
+def find_json_array(buffer, key, strings=False):
+    # (begin, end) offsets of the flat or nested array stored under key; end is one past the closing ']'
+    key_pos = buffer.find(b'"' + key + b'"')
+    if key_pos < 0:
+        return None
+    begin = buffer.find(b'[', key_pos)
+    colon = buffer.find(b':', key_pos)
+    if begin < 0 or colon < 0 or buffer[colon+1:begin].strip():
+        return None
+    # numbers contain no quotes, so a numeric array ends before the next key (or the end of the object);
+    # a flat array of chain ids ends at the first ']'
+    stop = buffer.find(b']', begin) + 1 if strings else buffer.find(b'"', begin + 1)
+    if stop <= 0:
+        stop = len(buffer)
+    end = buffer.rfind(b']', begin, stop) + 1
+    if end <= begin:
+        return None
+    return begin, end
+
+def parse_pae_rows(buffer, begin, end, token_mask, dtype):
+    ntokens = len(token_mask)
+    keep = np.flatnonzero(token_mask)
+    pae_matrix = np.empty((len(keep), len(keep)), dtype=dtype)
+    row = 0
+    out_row = 0
+    pos = buffer.find(b'[', begin + 1, end)  # first row
+    while 0 <= pos < end - 1:
+        # extend each block to the ']' that closes a row so blocks always hold whole rows
+        block_end = buffer.find(b']', min(pos + af3_read_block_bytes, end - 1), end) + 1
+        block = buffer[pos:block_end].translate(None, b'[]')
+        values = np.fromstring(block, dtype=dtype, sep=',')
+        if len(values) % ntokens:
+            return None
+        nrows = len(values) // ntokens
+        if row + nrows > ntokens:
+            return None
+        rows = values.reshape(nrows, ntokens)
+        block_keep = token_mask[row:row+nrows]
+        nkeep = int(np.count_nonzero(block_keep))
+        pae_matrix[out_row:out_row+nkeep] = rows[block_keep][:, keep]
+        row += nrows
+        out_row += nkeep
+        pos = buffer.find(b'[', block_end, end)
+    if row != ntokens:
+        return None
+    return pae_matrix
+
+def read_af3_full_data(pae_file_path, token_mask, dtype=np.float64):
+    token_mask = np.asarray(token_mask).astype(bool)
+    with open(pae_file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            data = {}
+            span = find_json_array(buffer, b'atom_plddts')
+            if span is not None:
+                data['atom_plddts'] = np.fromstring(buffer[span[0]+1:span[1]-1], dtype=np.float64, sep=',')
+            span = find_json_array(buffer, b'token_chain_ids', strings=True)
+            if span is not None:
+                data['token_chain_ids'] = np.array(buffer[span[0]:span[1]].split(b'"')[1::2]).astype(str)
+            span = find_json_array(buffer, b'pae')
+            if span is None:
+                return None
+            pae_matrix = parse_pae_rows(buffer, span[0], span[1], token_mask, dtype)
+            if pae_matrix is None:
+                return None
+            data['pae'] = pae_matrix
+    return data
+
+def read_af3_full_data_json(pae_file_path, token_mask, dtype=np.float64):
+    # fallback reader for files the streaming reader does not recognise
+    token_mask = np.asarray(token_mask).astype(bool)
+    with open(pae_file_path, 'r') as file:
+        data = json.load(file)
+    if 'atom_plddts' in data:
+        data['atom_plddts'] = np.array(data['atom_plddts'], dtype=np.float64)
+    if 'token_chain_ids' in data:
+        data['token_chain_ids'] = np.array(data['token_chain_ids']).astype(str)
+    if 'pae' in data:
+        data['pae'] = np.array(data['pae'], dtype=dtype)[np.ix_(token_mask, token_mask)]
+    return data
+
+
+def load_af3_pae(pae_file_path, structure, dtype=np.float64):
     # Example Alphafold3 server filenames
     #   fold_aurka_0_tpx2_0_full_data_0.json
     #   fold_aurka_0_tpx2_0_summary_confidences_0.json
@@ -521,17 +809,26 @@ if af3:
     #   confidences.json
     #   summary_confidences.json
     #   model1.cif
-    if os.path.exists(pae_file_path):
-        with open(pae_file_path, 'r') as file:
-            data = json.load(file)
-    else:
-        print("AF3 PAE file does not exist: ", pae_file_path)
-        sys.exit()
+    numres = structure.numres
+    unique_chains = structure.unique_chains
+
+    if not os.path.exists(pae_file_path):
+        raise FileNotFoundError(f"AF3 PAE file does not exist:  {pae_file_path}")
+
+    # PAE rows/columns are reduced to one token per residue while the file is read
+    token_mask = structure.token_array.astype(bool)
+    data = None
+    try:
+        data = read_af3_full_data(pae_file_path, token_mask, dtype)
+    except (ValueError, OSError):
+        data = None
+    if data is None:
+        data = read_af3_full_data_json(pae_file_path, token_mask, dtype)
 
     if "atom_plddts" in data:
-        atom_plddts=np.array(data['atom_plddts'])
-        plddt=atom_plddts[CA_atom_num]  # pull out residue plddts from Calpha atoms
-        cb_plddt=atom_plddts[CB_atom_num]  # pull out residue plddts from Cbeta atoms for pDockQ
+        atom_plddts=data['atom_plddts']
+        plddt=atom_plddts[structure.CA_atom_num]  # pull out residue plddts from Calpha atoms
+        cb_plddt=atom_plddts[structure.CB_atom_num]  # pull out residue plddts from Cbeta atoms for pDockQ
     else:
         plddt = np.zeros(numres)
         cb_plddt = np.zeros(numres)
@@ -540,14 +837,10 @@ if af3:
     # Modified residues have separate tokens for each atom, so need to pull out Calpha atom as token
     # Skip ligands
     if 'pae' in data:
-        pae_matrix_af3 = np.array(data['pae'])
+        pae_matrix = data['pae']
     else:
-        print("no PAE data in AF3 json file; quitting")
-        sys.exit()
+        raise ValueError("no PAE data in AF3 json file; quitting")
 
-    # Set pae_matrix for AF3 from subset of full PAE matrix from json file
-    token_array=np.array(token_mask)
-    pae_matrix = pae_matrix_af3[np.ix_(token_array.astype(bool), token_array.astype(bool))]
     # Get iptm matrix from AF3 summary_confidences file
     iptm_af3=   {chain1: {chain2: 0     for chain2 in unique_chains if chain1 != chain2} for chain1 in unique_chains}
 
@@ -568,6 +861,8 @@ if af3:
     else:
         print("AF3 summary file does not exist: ", summary_file_path)
 
+    return PAEData(pae_matrix, plddt, cb_plddt, iptm_af3, 'af3', data.get('token_chain_ids'))
+
 
 # Compute chain-pair-specific interchain PTM and PAE, count valid pairs, and count unique residues
 # First, create dictionaries of appropriate size: top keys are chain1 and chain2 where chain1 != chain2
@@ -588,423 +883,890 @@ if af3:
 # n0chn = number of residues in chain pair = len(chain1) + len(chain2)
 # n0dom = number of residues in chain pair that have good PAE values (<cutoff)
 # n0res = number of residues in chain2 that have good PAE residues for each residue of chain1
+class IpsaeResult:
+    def __init__(self, structure, pae, pae_cutoff, dist_cutoff):
+        self.structure =   structure
+        self.pae =         pae
+        self.pae_cutoff =  pae_cutoff
+        self.dist_cutoff = dist_cutoff
+        self.tile_rows =   None   # rows per LIS and ipTM/ipSAE tile (None = whole chain blocks)
+        self.peak_memory_mb = None   # peak memory allocated while scoring this model (traced profile stages only)
+        self.process_peak_memory_mb = None   # peak resident memory of the whole process so far
+        self.profile =     None   # ScoreProfile when instrumentation was requested
+
+        unique_chains = structure.unique_chains
+        numres = structure.numres
+
+        self.iptm_d0chn_byres  = init_chainpairdict_npzeros(unique_chains, numres)
+        self.ipsae_d0chn_byres = init_chainpairdict_npzeros(unique_chains, numres)
+        self.ipsae_d0dom_byres = init_chainpairdict_npzeros(unique_chains, numres)
+        self.ipsae_d0res_byres = init_chainpairdict_npzeros(unique_chains, numres)
+
+        self.iptm_d0chn_asym   = init_chainpairdict_zeros(unique_chains)
+        self.ipsae_d0chn_asym  = init_chainpairdict_zeros(unique_chains)
+        self.ipsae_d0dom_asym  = init_chainpairdict_zeros(unique_chains)
+        self.ipsae_d0res_asym  = init_chainpairdict_zeros(unique_chains)
+
+        self.iptm_d0chn_max    = init_chainpairdict_zeros(unique_chains)
+        self.ipsae_d0chn_max   = init_chainpairdict_zeros(unique_chains)
+        self.ipsae_d0dom_max   = init_chainpairdict_zeros(unique_chains)
+        self.ipsae_d0res_max   = init_chainpairdict_zeros(unique_chains)
+
+        self.iptm_d0chn_asymres   = init_chainpairdict_zeros(unique_chains)
+        self.ipsae_d0chn_asymres  = init_chainpairdict_zeros(unique_chains)
+        self.ipsae_d0dom_asymres  = init_chainpairdict_zeros(unique_chains)
+        self.ipsae_d0res_asymres  = init_chainpairdict_zeros(unique_chains)
+
+        self.iptm_d0chn_maxres    = init_chainpairdict_zeros(unique_chains)
+        self.ipsae_d0chn_maxres   = init_chainpairdict_zeros(unique_chains)
+        self.ipsae_d0dom_maxres   = init_chainpairdict_zeros(unique_chains)
+        self.ipsae_d0res_maxres   = init_chainpairdict_zeros(unique_chains)
+
+        self.n0chn       = init_chainpairdict_zeros(unique_chains)
+        self.n0dom       = init_chainpairdict_zeros(unique_chains)
+        self.n0dom_max   = init_chainpairdict_zeros(unique_chains)
+        self.n0res       = init_chainpairdict_zeros(unique_chains)
+        self.n0res_max   = init_chainpairdict_zeros(unique_chains)
+        self.n0res_byres = init_chainpairdict_npzeros(unique_chains, numres)
+
+        self.d0chn       = init_chainpairdict_zeros(unique_chains)
+        self.d0dom       = init_chainpairdict_zeros(unique_chains)
+        self.d0dom_max   = init_chainpairdict_zeros(unique_chains)
+        self.d0res       = init_chainpairdict_zeros(unique_chains)
+        self.d0res_max   = init_chainpairdict_zeros(unique_chains)
+        self.d0res_byres = init_chainpairdict_npzeros(unique_chains, numres)
+
+        self.valid_pair_counts           = init_chainpairdict_zeros(unique_chains)
+        self.dist_valid_pair_counts      = init_chainpairdict_zeros(unique_chains)
+        # interface residues as boolean masks over the residues of chain1 and of chain2
+        self.interface_chain1      = init_chainpairdict_masks(structure.layout)
+        self.interface_chain2      = init_chainpairdict_masks(structure.layout, second=True)
+        self.dist_interface_chain1 = init_chainpairdict_masks(structure.layout)
+        self.dist_interface_chain2 = init_chainpairdict_masks(structure.layout, second=True)
+
+        self.pDockQ  = init_chainpairdict_zeros(unique_chains)
+        self.pDockQ2 = init_chainpairdict_zeros(unique_chains)
+        self.LIS     = init_chainpairdict_zeros(unique_chains)
+        self.LIS_max = init_chainpairdict_zeros(unique_chains)
+
+        # False for chain pairs with no PAE < pae_cutoff (pruned: ipSAE values are zero)
+        self.interacting = {chain1: {chain2: False for chain2 in unique_chains if chain1 != chain2} for chain1 in unique_chains}
+
+
+# pDockQ and pDockQ2 for all chain pairs in a single pass over the contacts within pDockQ_cutoff.
+# Contacts are grouped by their chain-pair code and reduced with bincount: number of contact pairs,
+# number of unique residues in the interface, mean CB pLDDT of those residues, and mean PTM-transformed PAE (d0 = 10).
+def compute_pdockq(result, pae_matrix, cb_plddt, contacts):
+    numres = result.structure.numres
+    unique_chains = result.structure.unique_chains
+    ncodes = contacts.nchains**2
+
+    close = contacts.d <= pDockQ_cutoff
+    contact_i = contacts.i[close]
+    contact_j = contacts.j[close]
+    pair_code = contacts.pair_code[close]
+
+    npairs = np.bincount(pair_code, minlength=ncodes)
+    ptm_sum = np.bincount(pair_code, weights=ptm_func(pae_matrix[contact_i, contact_j], 10.0), minlength=ncodes)
+
+    # interface residues: both partners of every contact, counted once per chain pair
+    residue_keys = np.unique(np.concatenate([pair_code * numres + contact_i, pair_code * numres + contact_j]))
+    residue_pair_code = residue_keys // numres
+    nres = np.bincount(residue_pair_code, minlength=ncodes)
+    plddt_sum = np.bincount(residue_pair_code, weights=cb_plddt[residue_keys % numres], minlength=ncodes)
+
+    for nchain1, chain1 in enumerate(unique_chains):
+        for nchain2, chain2 in enumerate(unique_chains):
+            if chain1 == chain2: continue
+            code = nchain1 * contacts.nchains + nchain2
+            if npairs[code]>0:
+                mean_plddt = plddt_sum[code]/nres[code]
+                x=mean_plddt*math.log10(npairs[code])
+                result.pDockQ[chain1][chain2]= 0.724 / (1 + math.exp(-0.052*(x-152.611)))+0.018
+
+                mean_ptm = ptm_sum[code]/npairs[code]
+                x=mean_plddt*mean_ptm
+                result.pDockQ2[chain1][chain2]= 1.31 / (1 + math.exp(-0.075*(x-84.733)))+0.005
+            else:
+                result.pDockQ[chain1][chain2]=0.0
+                result.pDockQ2[chain1][chain2]=0.0
 
-iptm_d0chn_byres  = init_chainpairdict_npzeros(unique_chains, numres)
-ipsae_d0chn_byres = init_chainpairdict_npzeros(unique_chains, numres)
-ipsae_d0dom_byres = init_chainpairdict_npzeros(unique_chains, numres)
-ipsae_d0res_byres = init_chainpairdict_npzeros(unique_chains, numres)
-
-iptm_d0chn_asym   = init_chainpairdict_zeros(unique_chains)
-ipsae_d0chn_asym  = init_chainpairdict_zeros(unique_chains)
-ipsae_d0dom_asym  = init_chainpairdict_zeros(unique_chains)
-ipsae_d0res_asym  = init_chainpairdict_zeros(unique_chains)
-
-iptm_d0chn_max    = init_chainpairdict_zeros(unique_chains)
-ipsae_d0chn_max   = init_chainpairdict_zeros(unique_chains)
-ipsae_d0dom_max   = init_chainpairdict_zeros(unique_chains)
-ipsae_d0res_max   = init_chainpairdict_zeros(unique_chains)
-
-iptm_d0chn_asymres   = init_chainpairdict_zeros(unique_chains)
-ipsae_d0chn_asymres  = init_chainpairdict_zeros(unique_chains)
-ipsae_d0dom_asymres  = init_chainpairdict_zeros(unique_chains)
-ipsae_d0res_asymres  = init_chainpairdict_zeros(unique_chains)
-
-iptm_d0chn_maxres    = init_chainpairdict_zeros(unique_chains)
-ipsae_d0chn_maxres   = init_chainpairdict_zeros(unique_chains)
-ipsae_d0dom_maxres   = init_chainpairdict_zeros(unique_chains)
-ipsae_d0res_maxres   = init_chainpairdict_zeros(unique_chains)
-
-n0chn       = init_chainpairdict_zeros(unique_chains)
-n0dom       = init_chainpairdict_zeros(unique_chains)
-n0dom_max   = init_chainpairdict_zeros(unique_chains)
-n0res       = init_chainpairdict_zeros(unique_chains)
-n0res_max   = init_chainpairdict_zeros(unique_chains)
-n0res_byres = init_chainpairdict_npzeros(unique_chains, numres)
-
-d0chn       = init_chainpairdict_zeros(unique_chains)
-d0dom       = init_chainpairdict_zeros(unique_chains)
-d0dom_max   = init_chainpairdict_zeros(unique_chains)
-d0res       = init_chainpairdict_zeros(unique_chains)
-d0res_max   = init_chainpairdict_zeros(unique_chains)
-d0res_byres = init_chainpairdict_npzeros(unique_chains, numres)
-
-valid_pair_counts           = init_chainpairdict_zeros(unique_chains)
-dist_valid_pair_counts      = init_chainpairdict_zeros(unique_chains)
-unique_residues_chain1      = init_chainpairdict_set(unique_chains)
-unique_residues_chain2      = init_chainpairdict_set(unique_chains)
-dist_unique_residues_chain1 = init_chainpairdict_set(unique_chains)
-dist_unique_residues_chain2 = init_chainpairdict_set(unique_chains)
-pDockQ_unique_residues      = init_chainpairdict_set(unique_chains)
-
-pDockQ  = init_chainpairdict_zeros(unique_chains)
-pDockQ2 = init_chainpairdict_zeros(unique_chains)
-LIS     = init_chainpairdict_zeros(unique_chains)
-
-# pDockQ
-pDockQ_cutoff=8.0
-
-for chain1 in unique_chains:
-    for chain2 in unique_chains:
-        if chain1 == chain2:    continue
-        npairs=0
-        for i in range(numres):
-            if chains[i] != chain1:   continue
-            valid_pairs = (chains==chain2) & (distances[i] <= pDockQ_cutoff)
-            npairs += np.sum(valid_pairs)
-            if valid_pairs.any():
-                pDockQ_unique_residues[chain1][chain2].add(i)
-                chain2residues=np.where(valid_pairs)[0]
-
-                for residue in chain2residues:
-                    pDockQ_unique_residues[chain1][chain2].add(residue)
-
-        if npairs>0:
-            nres=len(list(pDockQ_unique_residues[chain1][chain2]))
-            mean_plddt= cb_plddt[ list(pDockQ_unique_residues[chain1][chain2])].mean()
-            x=mean_plddt*math.log10(npairs)
-            pDockQ[chain1][chain2]= 0.724 / (1 + math.exp(-0.052*(x-152.611)))+0.018
-        else:
-            mean_plddt=0.0
-            x=0.0
-            pDockQ[chain1][chain2]=0.0
-            nres=0
-
-# pDockQ2
 
-for chain1 in unique_chains:
-    for chain2 in unique_chains:
-        if chain1 == chain2:
-            continue
-        npairs=0
-        sum=0.0
-        for i in range(numres):
-            if chains[i] != chain1:
+# Multi-pair ipTM/ipSAE engine: for each ordered chain pair only the chain1 x chain2 sub-block of the PAE
+# matrix is transformed, and its PAE < cutoff mask is built once and shared by the
+# d0chn/d0dom/d0res kernels, the valid-pair counts and the interface residue masks.
+# Work scales with the number of interchain entries rather than chain pairs x numres^2.
+#
+# results holds one IpsaeResult per PAE cutoff (a cutoff sweep): each block is read and transformed with d0chn
+# once, ipTM_d0chn (no PAE cutoff) is computed once and shared, and only the masks and ipSAE kernels are per cutoff.
+#
+# Non-interacting pairs are pruned: when the minimum PAE of a block is >= cutoff there is no valid pair, so no mask
+# is built, and a pair with no valid pairs at all skips the ipSAE kernels (its ipSAE values, n0dom, n0res, interface
+# counts and interface masks are zero/empty by definition) and is marked interacting[chain1][chain2] = False.
+# Only ipTM_d0chn, which has no PAE cutoff, is still computed for it.
+#
+# With tile_rows set on the results, each block is processed in tiles of that many chain1 rows: a first pass over the
+# tiles collects the PAE < cutoff statistics that fix n0dom/d0dom and n0res/d0res, a second pass runs the kernel.
+# Only one tile (and its temporaries) is held in memory at a time.
+def compute_chain_pair_ipsae(results, pae_matrix):
+    structure =       results[0].structure
+    numres =          structure.numres
+    unique_chains =   structure.unique_chains
+    chain_pair_type = structure.chain_pair_type
+    layout =          structure.layout
+    pae_cutoffs =     [result.pae_cutoff for result in results]
+
+    for chain1 in unique_chains:
+        rows = layout.rows(chain1)
+        nrows = layout.lengths[chain1]
+        tile_rows = results[0].tile_rows or max(nrows, 1)
+        tiles = [slice(start, start + tile_rows) for start in range(0, nrows, tile_rows)]
+        for chain2 in unique_chains:
+            if chain1 == chain2:
                 continue
-            valid_pairs = (chains==chain2) & (distances[i] <= pDockQ_cutoff)
-            if valid_pairs.any():
-                npairs += np.sum(valid_pairs)
-                pae_list=pae_matrix[i][valid_pairs]
-                pae_list_ptm=ptm_func_vec(pae_list,10.0)
-                sum += pae_list_ptm.sum()
-
-        if npairs>0:
-            nres=len(list(pDockQ_unique_residues[chain1][chain2]))
-            mean_plddt= cb_plddt[ list(pDockQ_unique_residues[chain1][chain2])].mean()
-            mean_ptm = sum/npairs
-            x=mean_plddt*mean_ptm
-            pDockQ2[chain1][chain2]= 1.31 / (1 + math.exp(-0.075*(x-84.733)))+0.005
-        else:
-            mean_plddt=0.0
-            x=0.0
-            nres=0
-            pDockQ2[chain1][chain2]=0.0
-
-# LIS
-
-for chain1 in unique_chains:
-    for chain2 in unique_chains:
-        if chain1==chain2: continue
-
-        mask = (chains[:, None] == chain1) & (chains[None, :] == chain2)  # Select residues for (chain1, chain2)
-        selected_pae = pae_matrix[mask]  # Get PAE values for this pair
-
-        if selected_pae.size > 0:  # Ensure we have values
-            valid_pae = selected_pae[selected_pae < 12]  # Apply the threshold
-            if valid_pae.size > 0:
-                scores = (12 - valid_pae) / 12  # Compute scores
-                avg_score = np.mean(scores)  # Average score for (chain1, chain2)
-                LIS[chain1][chain2] = avg_score
+            ncols = layout.lengths[chain2]
+            pair_type = chain_pair_type[chain1][chain2]
+
+            n0chn = nrows + ncols # total number of residues in chain1 and chain2
+            d0chn = calc_d0(n0chn, pair_type)
+
+            # first pass: number of chain2 residues with PAE < cutoff for each chain1 residue, and the chain2 residues hit
+            n0res_rows = np.zeros((len(results), nrows), dtype=int)
+            cols_valid = np.zeros((len(results), ncols), dtype=bool)
+            for tile in tiles:
+                pae_block = layout.block(pae_matrix, chain1, chain2, tile)
+                block_min = pae_block.min() if pae_block.size else np.inf
+                for k, pae_cutoff in enumerate(pae_cutoffs):
+                    if block_min >= pae_cutoff:
+                        continue  # no PAE < cutoff in this tile
+                    valid_block = pae_block < pae_cutoff
+                    n0res_rows[k, tile] = np.sum(valid_block, axis=1)
+                    cols_valid[k] |= valid_block.any(axis=0)
+
+            d0res_byres = []
+            interacting = n0res_rows.any(axis=1)
+            for k, result in enumerate(results):
+                result.n0chn[chain1][chain2] = n0chn
+                result.d0chn[chain1][chain2] = d0chn
+                result.interacting[chain1][chain2] = bool(interacting[k])
+
+                # Track unique residues contributing to the IPSAE for chain1,chain2
+                result.valid_pair_counts[chain1][chain2] = np.sum(n0res_rows[k])
+                result.interface_chain1[chain1][chain2] = n0res_rows[k] > 0
+                result.interface_chain2[chain1][chain2] = cols_valid[k]
+
+                residues_1 = structure.count_residues(chain1, result.interface_chain1[chain1][chain2])
+                residues_2 = structure.count_residues(chain2, result.interface_chain2[chain1][chain2])
+                result.n0dom[chain1][chain2] = residues_1+residues_2
+                result.d0dom[chain1][chain2] = calc_d0(result.n0dom[chain1][chain2], pair_type)
+
+                n0res_byres_all = np.zeros(numres, dtype=int)
+                n0res_byres_all[rows] = n0res_rows[k]
+                d0res_byres.append(calc_d0_array(n0res_byres_all, pair_type))
+                result.n0res_byres[chain1][chain2] = n0res_byres_all
+                result.d0res_byres[chain1][chain2] = d0res_byres[k]
+
+            # ipTM_d0chn does not depend on the PAE cutoff: one array shared by all results
+            iptm_d0chn_byres = results[0].iptm_d0chn_byres[chain1][chain2]
+            for result in results:
+                result.iptm_d0chn_byres[chain1][chain2] = iptm_d0chn_byres
+
+            # second pass: ipTM/ipSAE kernels (the block from the first pass is reused when there is a single tile)
+            for tile in tiles:
+                if len(tiles) > 1:
+                    pae_block = layout.block(pae_matrix, chain1, chain2, tile)
+                tile_index = layout.rows(chain1, tile)
+                ptm_block_d0chn = ptm_func(pae_block, d0chn)
+                iptm_d0chn_byres[tile_index] = ptm_block_d0chn.mean(axis=1)
+                for k, result in enumerate(results):
+                    if not interacting[k]:
+                        continue
+                    (result.ipsae_d0chn_byres[chain1][chain2][tile_index],
+                     result.ipsae_d0dom_byres[chain1][chain2][tile_index],
+                     result.ipsae_d0res_byres[chain1][chain2][tile_index]) = ipsae_kernel(pae_block, ptm_block_d0chn, pae_block < result.pae_cutoff,
+                                                                                          result.d0dom[chain1][chain2],
+                                                                                          d0res_byres[k][tile_index].astype(pae_block.dtype))
+
+
+# Track unique residues contributing to iptm in interface (contacts within dist_cutoff with PAE < cutoff)
+def compute_dist_interface(result, pae_matrix, contacts):
+    structure =     result.structure
+    layout =        structure.layout
+    unique_chains = structure.unique_chains
+
+    result.dist_valid_pair_counts = init_chainpairdict_zeros(unique_chains)
+    result.dist_interface_chain1  = init_chainpairdict_masks(layout)
+    result.dist_interface_chain2  = init_chainpairdict_masks(layout, second=True)
+    for chain1 in unique_chains:
+        for chain2 in unique_chains:
+            if chain1 == chain2 or not result.interacting[chain1][chain2]:
+                continue  # no PAE < cutoff: no interface residues
+            contact_i, contact_j = contacts.pair(chain1, chain2, result.dist_cutoff, inclusive=False)
+            dist_valid = pae_matrix[contact_i, contact_j] < result.pae_cutoff
+            result.dist_valid_pair_counts[chain1][chain2] = np.sum(dist_valid)
+            result.dist_interface_chain1[chain1][chain2][layout.positions[contact_i[dist_valid]]] = True
+            result.dist_interface_chain2[chain1][chain2][layout.positions[contact_j[dist_valid]]] = True
+
+
+# Number of chain1 rows per tile so that one tile of LIS or of the ipTM/ipSAE kernel fits in memory_budget_mb.
+# The widest block a tile can have is numres columns; each element needs the PAE copy, three transformed
+# copies and two boolean masks at most.
+def tile_rows_for_budget(numres, itemsize, memory_budget_mb):
+    if memory_budget_mb is None:
+        return None
+    bytes_per_row = max(numres, 1) * (4 * itemsize + 2)
+    return max(1, int(memory_budget_mb * 1024**2 // bytes_per_row))
+
+
+# Peak resident memory of this process in MB since it started (None where the resource module is not available,
+# e.g. Windows). In a sweep, batch or long-lived app every later model reports the peak of the largest one before it.
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 1024**2  # bytes on macOS
+    return peak / 1024         # kilobytes on Linux
+
+
+# Opt-in instrumentation of one model (or one cutoff sweep): for each stage the wall time, the peak memory
+# allocated during the stage above what was allocated when it started (tracemalloc; numpy arrays included),
+# and element counts (tokens, chain pairs, contacts, valid PAE pairs, ...).
+# Pass profile=ScoreProfile() to score_files, score_model, score_sweep or write_outputs; the scorers also set
+# result.profile. profile.record() is a plain dict; profile.append_to(path) adds it as one JSON line to a log file.
+# trace_memory=False records times and counts only (tracemalloc slows down Python-level loops).
+# tracemalloc is process-wide: memory-traced stages of overlapping profiles (threads) run one at a time, their peaks
+# still include what other threads allocate meanwhile, and when tracemalloc was started outside of ipsae the tracer
+# is left alone and peak_mb is None.
+_trace_memory_lock = threading.Lock()
+
+class ScoreProfile:
+    def __init__(self, model=None, trace_memory=True):
+        self.model =        model
+        self.trace_memory = trace_memory
+        self.stages =       []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if not self.trace_memory:
+            with self._timed_stage(name) as record:
+                yield record
+            return
+        with _trace_memory_lock:
+            if tracemalloc.is_tracing():
+                with self._timed_stage(name) as record:
+                    record['peak_mb'] = None
+                    yield record
+                return
+            tracemalloc.start()
+            try:
+                with self._timed_stage(name) as record:
+                    try:
+                        yield record
+                    finally:
+                        record['peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024**2
+            finally:
+                tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def _timed_stage(self, name):
+        record = {'stage': name}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self.stages.append(record)
+
+    def record(self):
+        return {'model':         self.model,
+                'total_seconds': sum(stage['seconds'] for stage in self.stages),
+                'stages':        self.stages}
+
+    def append_to(self, log_path):
+        with open(log_path, 'a') as file:
+            file.write(json.dumps(self.record(), default=float) + "\n")
+
+# Stage context for an optional profile: yields the stage record to add counts to (a throwaway dict without a profile)
+def profile_stage(profile, name):
+    if profile is None:
+        return contextlib.nullcontext({})
+    return profile.stage(name)
+
+
+# LIS: mean of (12 - PAE)/12 over the chain1 x chain2 PAE values below 12, and its symmetric average LIS_max
+# (reported in the max rows). One pass over the matrix in chain1 row slabs: each slab is a view when the chains are
+# contiguous, and segment sums over the chain column ranges give the LIS of chain1 with every chain2 at once.
+# With tile_rows set on the result, each slab is processed in tiles of that many chain1 rows (column sums accumulated).
+def compute_lis(result, pae_matrix):
+    structure =     result.structure
+    unique_chains = structure.unique_chains
+    layout =        structure.layout
+
+    for chain1 in unique_chains:
+        nrows = layout.lengths[chain1]
+        tile_rows = result.tile_rows or max(nrows, 1)
+        column_sums = 0.0
+        column_counts = 0
+        for start in range(0, nrows, tile_rows):
+            tile = slice(start, start + tile_rows)
+            if layout.contiguous:
+                slab = pae_matrix[layout.rows(chain1, tile)]
             else:
-                LIS[chain1][chain2] = 0.0  # No valid values
-        else:
-            LIS[chain1][chain2]=0.0
-
-
-
-# calculate ipTM/ipSAE with and without PAE cutoff
-
-for chain1 in unique_chains:
-    for chain2 in unique_chains:
-        if chain1 == chain2:
-            continue
-
-        n0chn[chain1][chain2]=np.sum( chains==chain1) + np.sum(chains==chain2) # total number of residues in chain1 and chain2
-        d0chn[chain1][chain2]=calc_d0(n0chn[chain1][chain2], chain_pair_type[chain1][chain2])
-        ptm_matrix_d0chn=np.zeros((numres,numres))
-        ptm_matrix_d0chn=ptm_func_vec(pae_matrix,d0chn[chain1][chain2])
+                slab = pae_matrix[np.ix_(layout.indices[chain1][tile], layout.order)]
+            valid = slab < 12  # Apply the threshold
+            scores = np.where(valid, (12 - slab) / 12, 0.0)  # Compute scores
+            column_sums = column_sums + scores.sum(axis=0, dtype=np.float64)
+            column_counts = column_counts + valid.sum(axis=0)
+        score_sums = np.add.reduceat(column_sums, layout.starts)
+        counts = np.add.reduceat(column_counts, layout.starts)
+        for nchain2, chain2 in enumerate(unique_chains):
+            if chain1 == chain2: continue
+            if counts[nchain2] > 0:
+                result.LIS[chain1][chain2] = score_sums[nchain2] / counts[nchain2]  # Average score for (chain1, chain2)
+            else:
+                result.LIS[chain1][chain2] = 0.0  # No valid values
 
-        valid_pairs_iptm = (chains == chain2)
-        valid_pairs_matrix = np.outer(chains == chain1, chains == chain2) & (pae_matrix < pae_cutoff)
+    for chain1 in unique_chains:
+        for chain2 in unique_chains:
+            if chain1 == chain2: continue
+            result.LIS_max[chain1][chain2] = (result.LIS[chain1][chain2]+result.LIS[chain2][chain1])/2.0
 
-        for i in range(numres):
 
+# Asymmetric values (maximum over chain1 residues) and the residue that gives them, then the max over both directions
+def compute_asym_max(result):
+    structure =     result.structure
+    unique_chains = structure.unique_chains
 
-            if chains[i] != chain1:
+    # Compute interchain ipTM and ipSAE for each chain pair
+    for chain1 in unique_chains:
+        for chain2 in unique_chains:
+            if chain1 == chain2:
                 continue
 
-            valid_pairs_ipsae = valid_pairs_matrix[i]  # row for residue i of chain1
-            iptm_d0chn_byres[chain1][chain2][i] =  ptm_matrix_d0chn[i, valid_pairs_iptm].mean() if valid_pairs_iptm.any() else 0.0
-            ipsae_d0chn_byres[chain1][chain2][i] = ptm_matrix_d0chn[i, valid_pairs_ipsae].mean() if valid_pairs_ipsae.any() else 0.0
-
-            # Track unique residues contributing to the IPSAE for chain1,chain2
-            valid_pair_counts[chain1][chain2] += np.sum(valid_pairs_ipsae)
-            if valid_pairs_ipsae.any():
-                iresnum=residues[i]['resnum']
-                unique_residues_chain1[chain1][chain2].add(iresnum)
-                for j in np.where(valid_pairs_ipsae)[0]:
-                    jresnum=residues[j]['resnum']
-                    unique_residues_chain2[chain1][chain2].add(jresnum)
-
-            # Track unique residues contributing to iptm in interface
-            valid_pairs = (chains == chain2) & (pae_matrix[i] < pae_cutoff) & (distances[i] < dist_cutoff)
-            dist_valid_pair_counts[chain1][chain2] += np.sum(valid_pairs)
-
-            # Track unique residues contributing to the IPTM
-            if valid_pairs.any():
-                iresnum=residues[i]['resnum']
-                dist_unique_residues_chain1[chain1][chain2].add(iresnum)
-                for j in np.where(valid_pairs)[0]:
-                    jresnum=residues[j]['resnum']
-                    dist_unique_residues_chain2[chain1][chain2].add(jresnum)
-
-OUT2.write("i   AlignChn ScoredChain  AlignResNum  AlignResType  AlignRespLDDT      n0chn  n0dom  n0res    d0chn     d0dom     d0res   ipTM_pae  ipSAE_d0chn ipSAE_d0dom    ipSAE \n")
-for chain1 in unique_chains:
-    for chain2 in unique_chains:
-        if chain1 == chain2:
-            continue
-        residues_1 = len(unique_residues_chain1[chain1][chain2])
-        residues_2 = len(unique_residues_chain2[chain1][chain2])
-        n0dom[chain1][chain2] = residues_1+residues_2
-        d0dom[chain1][chain2] = calc_d0(n0dom[chain1][chain2], chain_pair_type[chain1][chain2])
-
-        ptm_matrix_d0dom = np.zeros((numres,numres))
-        ptm_matrix_d0dom = ptm_func_vec(pae_matrix,d0dom[chain1][chain2])
+            interchain_values = result.iptm_d0chn_byres[chain1][chain2]
+            max_index = np.argmax(interchain_values)
+            result.iptm_d0chn_asym[chain1][chain2] = interchain_values[max_index]
+            result.iptm_d0chn_asymres[chain1][chain2] = structure.residue_label(max_index)
+
+            interchain_values = result.ipsae_d0chn_byres[chain1][chain2]
+            max_index = np.argmax(interchain_values)
+            result.ipsae_d0chn_asym[chain1][chain2] = interchain_values[max_index]
+            result.ipsae_d0chn_asymres[chain1][chain2] = structure.residue_label(max_index)
+
+            interchain_values = result.ipsae_d0dom_byres[chain1][chain2]
+            max_index = np.argmax(interchain_values)
+            result.ipsae_d0dom_asym[chain1][chain2] = interchain_values[max_index]
+            result.ipsae_d0dom_asymres[chain1][chain2] = structure.residue_label(max_index)
+
+            interchain_values = result.ipsae_d0res_byres[chain1][chain2]
+            max_index = np.argmax(interchain_values)
+            result.ipsae_d0res_asym[chain1][chain2] = interchain_values[max_index]
+            result.ipsae_d0res_asymres[chain1][chain2] = structure.residue_label(max_index)
+            result.n0res[chain1][chain2]=result.n0res_byres[chain1][chain2][max_index]
+            result.d0res[chain1][chain2]=result.d0res_byres[chain1][chain2][max_index]
+
+            # pick maximum value for each chain pair for each iptm/ipsae type
+            if chain1 > chain2:
+                pick_pair_max(result.iptm_d0chn_asym,  result.iptm_d0chn_asymres,  result.iptm_d0chn_max,  result.iptm_d0chn_maxres,  chain1, chain2)
+                pick_pair_max(result.ipsae_d0chn_asym, result.ipsae_d0chn_asymres, result.ipsae_d0chn_max, result.ipsae_d0chn_maxres, chain1, chain2)
+                pick_pair_max(result.ipsae_d0dom_asym, result.ipsae_d0dom_asymres, result.ipsae_d0dom_max, result.ipsae_d0dom_maxres, chain1, chain2,
+                              result.n0dom, result.d0dom, result.n0dom_max, result.d0dom_max)
+                pick_pair_max(result.ipsae_d0res_asym, result.ipsae_d0res_asymres, result.ipsae_d0res_max, result.ipsae_d0res_maxres, chain1, chain2,
+                              result.n0res, result.d0res, result.n0res_max, result.d0res_max)
+
+
+# Score one model. All state lives in the returned IpsaeResult, so this can be called any number of times
+# in one process (and from several threads) without reloading numpy or re-reading unrelated models.
+#
+# Memory-bounded mode for very large complexes:
+#   float32=True           compute in float32 (the PAE matrix is cast once unless it was loaded as float32)
+#   memory_budget_mb=<MB>  process the LIS slabs and ipTM/ipSAE blocks in row tiles sized from the token count to fit the budget
+# result.tile_rows reports the tile size used, result.peak_memory_mb the peak memory allocated while scoring (with a
+# memory-tracing profile, otherwise None) and result.process_peak_memory_mb the peak of the whole process so far.
+def score_model(structure, pae, pae_cutoff, dist_cutoff, float32=False, memory_budget_mb=None, profile=None):
+    results = score_sweep(structure, pae, [pae_cutoff], [dist_cutoff], float32=float32, memory_budget_mb=memory_budget_mb, profile=profile)
+    return results[(pae_cutoff, dist_cutoff)]
+
+
+# Score one model for every combination of PAE and distance cutoffs; returns {(pae_cutoff, dist_cutoff): IpsaeResult}.
+# Contacts, pDockQ/pDockQ2, LIS and ipTM_d0chn do not depend on the cutoffs and are computed once;
+# each PAE block is read once for all PAE cutoffs, and the distance cutoffs only change the interface counts.
+def score_sweep(structure, pae, pae_cutoffs, dist_cutoffs, float32=False, memory_budget_mb=None, profile=None):
+    pae_cutoffs =  list(dict.fromkeys(pae_cutoffs))
+    dist_cutoffs = list(dict.fromkeys(dist_cutoffs))
+    pae_matrix =   pae.pae_matrix
+    if float32:
+        pae_matrix = pae_matrix.astype(np.float32, copy=False)
+    tile_rows = tile_rows_for_budget(structure.numres, pae_matrix.itemsize, memory_budget_mb)
+    first_stage = len(profile.stages) if profile is not None else 0
+
+    nchains = len(structure.unique_chains)
+
+    # Sparse interchain contacts replace the dense numres x numres distance matrix
+    with profile_stage(profile, 'contacts') as record:
+        contacts = ContactList(structure, max([pDockQ_cutoff] + dist_cutoffs))
+        record['contacts'] = len(contacts.i)
+
+    # pDockQ, pDockQ2 and LIS (no cutoff dependence)
+    shared = IpsaeResult(structure, pae, pae_cutoffs[0], dist_cutoffs[0])
+    shared.tile_rows = tile_rows
+    with profile_stage(profile, 'pdockq_pdockq2') as record:
+        compute_pdockq(shared, pae_matrix, pae.cb_plddt, contacts)
+        record['pdockq_contacts'] = int(np.count_nonzero(contacts.d <= pDockQ_cutoff))
+    with profile_stage(profile, 'lis') as record:
+        compute_lis(shared, pae_matrix)
+        record['chain_pairs'] = nchains * (nchains - 1)
+
+    # calculate ipTM/ipSAE with and without PAE cutoff, for all PAE cutoffs at once
+    by_pae_cutoff = [IpsaeResult(structure, pae, pae_cutoff, dist_cutoffs[0]) for pae_cutoff in pae_cutoffs]
+    for result in by_pae_cutoff:
+        result.tile_rows = tile_rows
+        result.pDockQ =    shared.pDockQ
+        result.pDockQ2 =   shared.pDockQ2
+        result.LIS =       shared.LIS
+        result.LIS_max =   shared.LIS_max
+    with profile_stage(profile, 'iptm_ipsae') as record:
+        compute_chain_pair_ipsae(by_pae_cutoff, pae_matrix)
+        record['chain_pairs'] = nchains * (nchains - 1)
+        record['pae_cutoffs'] = len(pae_cutoffs)
+        record['valid_pae_pairs'] = {result.pae_cutoff: int(sum(count for pairs in result.valid_pair_counts.values() for count in pairs.values()))
+                                     for result in by_pae_cutoff}
+        record['interacting_pairs'] = {result.pae_cutoff: sum(flag for pairs in result.interacting.values() for flag in pairs.values())
+                                       for result in by_pae_cutoff}
+
+    results = {}
+    with profile_stage(profile, 'asym_max_interface') as record:
+        for base in by_pae_cutoff:
+            compute_asym_max(base)
+            for dist_cutoff in dist_cutoffs:
+                result = copy.copy(base)
+                result.dist_cutoff = dist_cutoff
+                compute_dist_interface(result, pae_matrix, contacts)
+                results[(base.pae_cutoff, dist_cutoff)] = result
+        record['cutoff_pairs'] = len(results)
+
+    stage_peaks = [stage['peak_mb'] for stage in profile.stages[first_stage:] if stage.get('peak_mb') is not None] if profile is not None else []
+    process_peak = peak_memory_mb()
+    for result in results.values():
+        result.peak_memory_mb = max(stage_peaks) if stage_peaks else None
+        result.process_peak_memory_mb = process_peak
+        result.profile = profile
+    return results
+
+
+# pick maximum of the A->B and B->A values (and the residue, n0 and d0 that go with it) for a chain pair
+def pick_pair_max(asym, asymres, maxdict, maxresdict, chain1, chain2, n0=None, d0=None, n0_max=None, d0_max=None):
+    maxvalue=max(asym[chain1][chain2], asym[chain2][chain1])
+    if maxvalue==asym[chain1][chain2]:
+        (c1, c2) = (chain1, chain2)
+    else:
+        (c1, c2) = (chain2, chain1)
+    maxdict[chain1][chain2]=maxvalue
+    maxresdict[chain1][chain2]=asymres[c1][c2]
+    maxdict[chain2][chain1]=maxvalue
+    maxresdict[chain2][chain1]=asymres[c1][c2]
+    if n0 is not None:
+        n0_max[chain1][chain2]=n0[c1][c2]
+        n0_max[chain2][chain1]=n0[c1][c2]
+        d0_max[chain1][chain2]=d0[c1][c2]
+        d0_max[chain2][chain1]=d0[c1][c2]
+
+
+# Read the structure and PAE files of one model
+def load_model(pae_file_path, pdb_path, float32=False, profile=None):
+    model_type, cif = model_type_from_paths(pae_file_path, pdb_path)
+    if profile is not None and profile.model is None:
+        profile.model = pdb_path
+    with profile_stage(profile, 'parse') as record:
+        structure = read_structure(pdb_path, cif)
+        record['tokens'] = len(structure.token_array)
+        record['residues'] = structure.numres
+        record['chains'] = len(structure.unique_chains)
+    with profile_stage(profile, 'pae_load') as record:
+        pae = load_pae(pae_file_path, structure, model_type, float32=float32)
+        record['pae_elements'] = int(pae.pae_matrix.size)
+    return structure, pae
+
+# Read structure and PAE files and score them in one call
+def score_files(pae_file_path, pdb_path, pae_cutoff, dist_cutoff, float32=False, memory_budget_mb=None, profile=None):
+    structure, pae = load_model(pae_file_path, pdb_path, float32=float32, profile=profile)
+    return score_model(structure, pae, pae_cutoff, dist_cutoff, float32=float32, memory_budget_mb=memory_budget_mb, profile=profile)
+
+
+# Per-residue output file (_byres.txt), formatted in one pass over the byres_columns arrays
+byres_header = "i   AlignChn ScoredChain  AlignResNum  AlignResType  AlignRespLDDT      n0chn  n0dom  n0res    d0chn     d0dom     d0res   ipTM_pae  ipSAE_d0chn ipSAE_d0dom    ipSAE \n"
+byres_line_format = ('%-4d    %-4s      %-4s      %4d           %-3s        %8.2f         %5d  %5d  %5d  '
+                     '%8.3f  %8.3f  %8.3f   %8.4f    %8.4f    %8.4f    %8.4f\n')
+
+def write_byres(result, OUT2):
+    columns = byres_columns(result)
+    values = [columns[name].tolist() for name in byres_column_names]
+    OUT2.write(byres_header)
+    OUT2.write(''.join(map(byres_line_format.__mod__, zip(*values))))
+
+
+# Number of interface residues of each ordered chain pair from masks over the chain1 (or chain2 with second=True) residues
+def count_interface_residues(structure, masks, second=False):
+    return {chain1: {chain2: structure.count_residues(chain2 if second else chain1, mask) for chain2, mask in pairs.items()}
+            for chain1, pairs in masks.items()}
+
+
+# Chain-pair summary rows in output order: for each chain pair A<B the A->B and B->A asym rows, then the max row.
+# One dict per row with the values of the .txt columns (chain1/chain2 as printed in Chn1/Chn2)
+def summary_rows(result):
+    unique_chains = result.structure.unique_chains
+    iptm_af_pairs = result.pae.iptm_af
+    boltz = result.pae.model_type == 'boltz'
+    nres1 = count_interface_residues(result.structure, result.interface_chain1)
+    nres2 = count_interface_residues(result.structure, result.interface_chain2, second=True)
+    dist1 = count_interface_residues(result.structure, result.dist_interface_chain1)
+    dist2 = count_interface_residues(result.structure, result.dist_interface_chain2, second=True)
+
+    chainpairs=set()
+    for chain1 in unique_chains:
+        for chain2 in unique_chains:
+            if chain1 >= chain2: continue
+            chainpairs.add(chain1 + "-" + chain2)
+
+    rows = []
+    for pair in sorted(chainpairs):
+        (chain_a, chain_b) = pair.split("-")
+        pair1 = (chain_a, chain_b)
+        pair2 = (chain_b, chain_a)
+        for pair in (pair1, pair2):
+            chain1=pair[0]
+            chain2=pair[1]
+            iptm_af = iptm_af_pairs[chain1][chain2]
+            rows.append({
+                'chain1':      chain1,
+                'chain2':      chain2,
+                'pae_cutoff':  result.pae_cutoff,
+                'dist_cutoff': result.dist_cutoff,
+                'type':        'asym',
+                'ipsae':       result.ipsae_d0res_asym[chain1][chain2],
+                'ipsae_d0chn': result.ipsae_d0chn_asym[chain1][chain2],
+                'ipsae_d0dom': result.ipsae_d0dom_asym[chain1][chain2],
+                'iptm_af':     iptm_af,
+                'iptm_d0chn':  result.iptm_d0chn_asym[chain1][chain2],
+                'pdockq':      result.pDockQ[chain1][chain2],
+                'pdockq2':     result.pDockQ2[chain1][chain2],
+                'lis':         result.LIS[chain1][chain2],
+                'n0res':       int(result.n0res[chain1][chain2]),
+                'n0chn':       int(result.n0chn[chain1][chain2]),
+                'n0dom':       int(result.n0dom[chain1][chain2]),
+                'd0res':       result.d0res[chain1][chain2],
+                'd0chn':       result.d0chn[chain1][chain2],
+                'd0dom':       result.d0dom[chain1][chain2],
+                'nres1':       nres1[chain1][chain2],
+                'nres2':       nres2[chain1][chain2],
+                'dist1':       dist1[chain1][chain2],
+                'dist2':       dist2[chain1][chain2],
+            })
+            if chain1 > chain2:
+                iptm_af_value=iptm_af
+                if boltz:
+                    iptm_af_value=max(iptm_af_pairs[chain1][chain2], iptm_af_pairs[chain2][chain1])
+                rows.append({
+                    'chain1':      chain2,
+                    'chain2':      chain1,
+                    'pae_cutoff':  result.pae_cutoff,
+                    'dist_cutoff': result.dist_cutoff,
+                    'type':        'max',
+                    'ipsae':       result.ipsae_d0res_max[chain1][chain2],
+                    'ipsae_d0chn': result.ipsae_d0chn_max[chain1][chain2],
+                    'ipsae_d0dom': result.ipsae_d0dom_max[chain1][chain2],
+                    'iptm_af':     iptm_af_value,
+                    'iptm_d0chn':  result.iptm_d0chn_max[chain1][chain2],
+                    'pdockq':      result.pDockQ[chain1][chain2],
+                    'pdockq2':     max(result.pDockQ2[chain1][chain2], result.pDockQ2[chain2][chain1]),
+                    'lis':         result.LIS_max[chain1][chain2],
+                    'n0res':       int(result.n0res_max[chain1][chain2]),
+                    'n0chn':       int(result.n0chn[chain1][chain2]),
+                    'n0dom':       int(result.n0dom_max[chain1][chain2]),
+                    'd0res':       result.d0res_max[chain1][chain2],
+                    'd0chn':       result.d0chn[chain1][chain2],
+                    'd0dom':       result.d0dom_max[chain1][chain2],
+                    'nres1':       max(nres2[chain1][chain2], nres1[chain2][chain1]),
+                    'nres2':       max(nres1[chain1][chain2], nres2[chain2][chain1]),
+                    'dist1':       max(dist2[chain1][chain2], dist1[chain2][chain1]),
+                    'dist2':       max(dist1[chain1][chain2], dist2[chain2][chain1]),
+                })
+    return rows
+
+
+# Chain-pair summary output (.txt) and PyMOL alias script (.pml); OUT=None or PML=None skips that file,
+# header=False leaves out the column header line (used to append several cutoffs to one table)
+def write_summary(result, OUT, PML, pdb_stem, header=True):
+    pae_string, dist_string = cutoff_strings(result.pae_cutoff, result.dist_cutoff)
+
+    if header and OUT is not None:
+        OUT.write("\nChn1 Chn2  PAE Dist  Type   ipSAE    ipSAE_d0chn ipSAE_d0dom  ipTM_af  ipTM_d0chn     pDockQ     pDockQ2    LIS       n0res  n0chn  n0dom   d0res   d0chn   d0dom  nres1   nres2   dist1   dist2  Model\n")
+    if PML is not None:
+        PML.write("# Chn1 Chn2  PAE Dist  Type   ipSAE    ipSAE_d0chn ipSAE_d0dom  ipTM_af  ipTM_d0chn     pDockQ     pDockQ2    LIS      n0res  n0chn  n0dom   d0res   d0chn   d0dom  nres1   nres2   dist1   dist2  Model\n")
+    for row in summary_rows(result):
+        outstring=f'{row["chain1"]}    {row["chain2"]}     {pae_string:3}  {dist_string:3}  {row["type"]:5} ' + (
+            f'{row["ipsae"]:8.6f}    '
+            f'{row["ipsae_d0chn"]:8.6f}    '
+            f'{row["ipsae_d0dom"]:8.6f}    '
+            f'{row["iptm_af"]:5.3f}    '
+            f'{row["iptm_d0chn"]:8.6f}    '
+            f'{row["pdockq"]:8.4f}   '
+            f'{row["pdockq2"]:8.4f}   '
+            f'{row["lis"]:8.4f}   '
+            f'{row["n0res"]:5d}  '
+            f'{row["n0chn"]:5d}  '
+            f'{row["n0dom"]:5d}  '
+            f'{row["d0res"]:6.2f}  '
+            f'{row["d0chn"]:6.2f}  '
+            f'{row["d0dom"]:6.2f}  '
+            f'{row["nres1"]:5d}   '
+            f'{row["nres2"]:5d}   '
+            f'{row["dist1"]:5d}   '
+            f'{row["dist2"]:5d}   '
+            f'{pdb_stem}\n')
+        if OUT is not None:
+            OUT.write(outstring)
+        if PML is not None:
+            PML.write("# " + outstring)
 
-        valid_pairs_matrix = np.outer(chains == chain1, chains == chain2) & (pae_matrix < pae_cutoff)
+        # PyMOL alias after the A->B asym row, and for B->A after the max row; blank line after each chain pair
+        if row["type"] == 'asym' and row["chain1"] < row["chain2"]:
+            write_pml_alias(result, PML, row["chain1"], row["chain2"])
+        elif row["type"] == 'max':
+            write_pml_alias(result, PML, row["chain2"], row["chain1"])
+            if OUT is not None:
+                OUT.write("\n")
 
-        # Assuming valid_pairs_matrix is already defined
-        n0res_byres_all = np.sum(valid_pairs_matrix, axis=1)
-        d0res_byres_all = calc_d0_array(n0res_byres_all, chain_pair_type[chain1][chain2])
 
-        n0res_byres[chain1][chain2] = n0res_byres_all
-        d0res_byres[chain1][chain2] = d0res_byres_all
+def write_pml_alias(result, PML, chain1, chain2):
+    if PML is None:
+        return
+    if chain1 in chaincolor:
+        color1=chaincolor[chain1]
+    else:
+        color1='magenta'
 
-        for i in range(numres):
-            if chains[i] != chain1:
+    if chain2 in chaincolor:
+        color2=chaincolor[chain2]
+    else:
+        color2='marine'
+
+    chain_pair= f'color_{chain1}_{chain2}'
+    residues1 = result.structure.residue_numbers(chain1, result.interface_chain1[chain1][chain2]).tolist()
+    residues2 = result.structure.residue_numbers(chain2, result.interface_chain2[chain1][chain2]).tolist()
+    chain1_residues = f'chain  {chain1} and resi {contiguous_ranges(residues1)}'
+    chain2_residues = f'chain  {chain2} and resi {contiguous_ranges(residues2)}'
+    PML.write(f'alias {chain_pair}, color gray80, all; color {color1}, {chain1_residues}; color {color2}, {chain2_residues}\n\n')
+
+
+# Per-residue values as columns, in the row order of the _byres.txt file
+# (for each ordered chain pair, the residues of the aligned chain1)
+byres_column_names = ('i', 'chain1', 'chain2', 'resnum', 'restype', 'plddt', 'n0chn', 'n0dom', 'n0res',
+                      'd0chn', 'd0dom', 'd0res', 'iptm_d0chn', 'ipsae_d0chn', 'ipsae_d0dom', 'ipsae')
+
+def byres_columns(result):
+    structure = result.structure
+    unique_chains = structure.unique_chains
+    plddt = np.asarray(result.pae.plddt)
+
+    parts = {name: [] for name in byres_column_names}
+    layout = structure.layout
+    for chain1 in unique_chains:
+        rows = layout.rows(chain1)
+        for chain2 in unique_chains:
+            if chain1 == chain2:
                 continue
-            valid_pairs = valid_pairs_matrix[i]
-            ipsae_d0dom_byres[chain1][chain2][i] = ptm_matrix_d0dom[i, valid_pairs].mean() if valid_pairs.any() else 0.0
-
-            ptm_row_d0res=np.zeros((numres))
-            ptm_row_d0res=ptm_func_vec(pae_matrix[i], d0res_byres[chain1][chain2][i])
-            ipsae_d0res_byres[chain1][chain2][i] = ptm_row_d0res[valid_pairs].mean() if valid_pairs.any() else 0.0
-
-            outstring = f'{i+1:<4d}    ' + (
-                f'{chain1:4}      '
-                f'{chain2:4}      '
-                f'{residues[i]["resnum"]:4d}           '
-                f'{residues[i]["res"]:3}        '
-                f'{plddt[i]:8.2f}         '
-                f'{int(n0chn[chain1][chain2]):5d}  '
-                f'{int(n0dom[chain1][chain2]):5d}  '
-                f'{int(n0res_byres[chain1][chain2][i]):5d}  '
-                f'{d0chn[chain1][chain2]:8.3f}  '
-                f'{d0dom[chain1][chain2]:8.3f}  '
-                f'{d0res_byres[chain1][chain2][i]:8.3f}   '
-                f'{iptm_d0chn_byres[chain1][chain2][i]:8.4f}    '
-                f'{ipsae_d0chn_byres[chain1][chain2][i]:8.4f}    '
-                f'{ipsae_d0dom_byres[chain1][chain2][i]:8.4f}    '
-                f'{ipsae_d0res_byres[chain1][chain2][i]:8.4f}\n'
-            )
-            OUT2.write(outstring)
-
-# Compute interchain ipTM and ipSAE for each chain pair
-for chain1 in unique_chains:
-    for chain2 in unique_chains:
-        if chain1 == chain2:
+            nrows = layout.lengths[chain1]
+            parts['i'].append(layout.indices[chain1] + 1)
+            parts['chain1'].append(np.full(nrows, chain1))
+            parts['chain2'].append(np.full(nrows, chain2))
+            parts['resnum'].append(structure.resnums[rows])
+            parts['restype'].append(structure.residue_types[rows])
+            parts['plddt'].append(plddt[rows])
+            parts['n0chn'].append(np.full(nrows, int(result.n0chn[chain1][chain2])))
+            parts['n0dom'].append(np.full(nrows, int(result.n0dom[chain1][chain2])))
+            parts['n0res'].append(result.n0res_byres[chain1][chain2][rows].astype(int))
+            parts['d0chn'].append(np.full(nrows, float(result.d0chn[chain1][chain2])))
+            parts['d0dom'].append(np.full(nrows, float(result.d0dom[chain1][chain2])))
+            parts['d0res'].append(result.d0res_byres[chain1][chain2][rows])
+            parts['iptm_d0chn'].append(result.iptm_d0chn_byres[chain1][chain2][rows])
+            parts['ipsae_d0chn'].append(result.ipsae_d0chn_byres[chain1][chain2][rows])
+            parts['ipsae_d0dom'].append(result.ipsae_d0dom_byres[chain1][chain2][rows])
+            parts['ipsae'].append(result.ipsae_d0res_byres[chain1][chain2][rows])
+    return {name: np.concatenate(values) if values else np.array([]) for name, values in parts.items()}
+
+# Chain-pair summary rows (summary_rows) as columns
+def summary_columns(result):
+    rows = summary_rows(result)
+    names = rows[0].keys() if rows else ()
+    return {name: np.array([row[name] for row in rows]) for name in names}
+
+
+# Structured output: typed columnar tables (Parquet or Arrow IPC file, needs pyarrow) and compact JSON
+def write_table(columns, path, table_format):
+    if pa is None:
+        raise ImportError("Parquet and Arrow output need pyarrow:  pip install pyarrow")
+    table = pa.table(columns)
+    if table_format == 'parquet':
+        pq.write_table(table, path)
+    else:
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+def write_json_columns(columns, path, result):
+    data = {'pae_cutoff':  result.pae_cutoff,
+            'dist_cutoff': result.dist_cutoff,
+            'columns':     {name: values.tolist() for name, values in columns.items()}}
+    with open(path, 'w') as file:
+        json.dump(data, file, separators=(',', ':'))
+
+
+# Output kinds and the file each one writes (path_stem = <model>_<PAE>_<DIST>):
+#   txt      chain-pair summary            path_stem.txt
+#   pml      PyMOL alias script            path_stem.pml
+#   byres    per-residue text              path_stem_byres.txt   (opt-in: --byres on the command line)
+#   json / parquet / arrow                 chain-pair summary table    path_stem.json / .parquet / .arrow
+#   byres_json / byres_parquet / byres_arrow   per-residue table       path_stem_byres.json / .parquet / .arrow
+output_kinds = ('txt', 'pml', 'byres', 'json', 'parquet', 'arrow', 'byres_json', 'byres_parquet', 'byres_arrow')
+default_outputs = ('txt', 'pml')
+
+def check_output_kinds(outputs):
+    unknown = [kind for kind in outputs if kind not in output_kinds]
+    if unknown:
+        raise ValueError(f"Unknown output kind(s) {', '.join(unknown)}; choose from {', '.join(output_kinds)}")
+    if pa is None and any(kind.endswith('parquet') or kind.endswith('arrow') for kind in outputs):
+        raise ImportError("Parquet and Arrow output need pyarrow:  pip install pyarrow")
+
+
+# Write the selected output files next to the structure file
+def write_outputs(result, pdb_path, outputs=default_outputs, profile=None):
+    with profile_stage(profile, 'output') as record:
+        record['outputs'] = list(outputs)
+        record['cutoffs'] = [result.pae_cutoff, result.dist_cutoff]
+        write_output_files(result, pdb_path, outputs)
+
+def write_output_files(result, pdb_path, outputs):
+    check_output_kinds(outputs)
+    pdb_stem, path_stem = output_stems(pdb_path, result.pae_cutoff, result.dist_cutoff)
+    if 'txt' in outputs or 'pml' in outputs:
+        OUT = open(path_stem + ".txt",'w') if 'txt' in outputs else None
+        PML = open(path_stem + ".pml",'w') if 'pml' in outputs else None
+        try:
+            write_summary(result, OUT, PML, pdb_stem)
+        finally:
+            for file in (OUT, PML):
+                if file is not None:
+                    file.close()
+    if 'byres' in outputs:
+        with open(path_stem + "_byres.txt",'w') as OUT2:
+            write_byres(result, OUT2)
+
+    for prefix, suffix, make_columns in (('', '', summary_columns), ('byres_', '_byres', byres_columns)):
+        kinds = [kind for kind in ('json', 'parquet', 'arrow') if prefix + kind in outputs]
+        if not kinds:
             continue
-
-        interchain_values = iptm_d0chn_byres[chain1][chain2]
-        max_index = np.argmax(interchain_values)
-        iptm_d0chn_asym[chain1][chain2] = interchain_values[max_index]
-        iptm_d0chn_asymres[chain1][chain2] = residues[max_index]['residue'] if max_index is not None else "None"
-
-        interchain_values = ipsae_d0chn_byres[chain1][chain2]
-        max_index = np.argmax(interchain_values)
-        ipsae_d0chn_asym[chain1][chain2] = interchain_values[max_index]
-        ipsae_d0chn_asymres[chain1][chain2] = residues[max_index]['residue'] if max_index is not None else "None"
-
-        interchain_values = ipsae_d0dom_byres[chain1][chain2]
-        max_index = np.argmax(interchain_values)
-        ipsae_d0dom_asym[chain1][chain2] = interchain_values[max_index]
-        ipsae_d0dom_asymres[chain1][chain2] = residues[max_index]['residue'] if max_index is not None else "None"
-
-        interchain_values = ipsae_d0res_byres[chain1][chain2]
-        max_index = np.argmax(interchain_values)
-        ipsae_d0res_asym[chain1][chain2] = interchain_values[max_index]
-        ipsae_d0res_asymres[chain1][chain2] = residues[max_index]['residue'] if max_index is not None else "None"
-        n0res[chain1][chain2]=n0res_byres[chain1][chain2][max_index]
-        d0res[chain1][chain2]=d0res_byres[chain1][chain2][max_index]
-
-        # pick maximum value for each chain pair for each iptm/ipsae type
-        if chain1 > chain2:
-            maxvalue=max(iptm_d0chn_asym[chain1][chain2], iptm_d0chn_asym[chain2][chain1])
-            if maxvalue==iptm_d0chn_asym[chain1][chain2]: maxres=iptm_d0chn_asymres[chain1][chain2]
-            else: maxres=iptm_d0chn_asymres[chain2][chain1]
-            iptm_d0chn_max[chain1][chain2]=maxvalue
-            iptm_d0chn_maxres[chain1][chain2]=maxres
-            iptm_d0chn_max[chain2][chain1]=maxvalue
-            iptm_d0chn_maxres[chain2][chain1]=maxres
-
-            maxvalue=max(ipsae_d0chn_asym[chain1][chain2], ipsae_d0chn_asym[chain2][chain1])
-            if maxvalue==ipsae_d0chn_asym[chain1][chain2]: maxres=ipsae_d0chn_asymres[chain1][chain2]
-            else: maxres=ipsae_d0chn_asymres[chain2][chain1]
-            ipsae_d0chn_max[chain1][chain2]=maxvalue
-            ipsae_d0chn_maxres[chain1][chain2]=maxres
-            ipsae_d0chn_max[chain2][chain1]=maxvalue
-            ipsae_d0chn_maxres[chain2][chain1]=maxres
-
-            maxvalue=max(ipsae_d0dom_asym[chain1][chain2], ipsae_d0dom_asym[chain2][chain1])
-            if maxvalue==ipsae_d0dom_asym[chain1][chain2]:
-                maxres=ipsae_d0dom_asymres[chain1][chain2]
-                maxn0=n0dom[chain1][chain2]
-                maxd0=d0dom[chain1][chain2]
+        columns = make_columns(result)
+        for kind in kinds:
+            if kind == 'json':
+                write_json_columns(columns, path_stem + suffix + ".json", result)
             else:
-                maxres=ipsae_d0dom_asymres[chain2][chain1]
-                maxn0=n0dom[chain2][chain1]
-                maxd0=d0dom[chain2][chain1]
-            ipsae_d0dom_max[chain1][chain2]=maxvalue
-            ipsae_d0dom_maxres[chain1][chain2]=maxres
-            ipsae_d0dom_max[chain2][chain1]=maxvalue
-            ipsae_d0dom_maxres[chain2][chain1]=maxres
-            n0dom_max[chain1][chain2]=maxn0
-            n0dom_max[chain2][chain1]=maxn0
-            d0dom_max[chain1][chain2]=maxd0
-            d0dom_max[chain2][chain1]=maxd0
-
-            maxvalue=max(ipsae_d0res_asym[chain1][chain2], ipsae_d0res_asym[chain2][chain1])
-            if maxvalue==ipsae_d0res_asym[chain1][chain2]:
-                maxres=ipsae_d0res_asymres[chain1][chain2]
-                maxn0=n0res[chain1][chain2]
-                maxd0=d0res[chain1][chain2]
-            else:
-                maxres=ipsae_d0res_asymres[chain2][chain1]
-                maxn0=n0res[chain2][chain1]
-                maxd0=d0res[chain2][chain1]
-            ipsae_d0res_max[chain1][chain2]=maxvalue
-            ipsae_d0res_maxres[chain1][chain2]=maxres
-            ipsae_d0res_max[chain2][chain1]=maxvalue
-            ipsae_d0res_maxres[chain2][chain1]=maxres
-            n0res_max[chain1][chain2]=maxn0
-            n0res_max[chain2][chain1]=maxn0
-            d0res_max[chain1][chain2]=maxd0
-            d0res_max[chain2][chain1]=maxd0
-
+                write_table(columns, path_stem + suffix + "." + kind, kind)
 
-chaincolor={'A':'magenta',   'B':'marine',   'C':'lime',        'D':'orange',
-            'E':'yellow',    'F':'cyan',     'G':'lightorange', 'H':'pink',
-            'I':'deepteal',  'J':'forest',   'K':'lightblue',   'L':'slate',
-            'M':'violet',    'N':'arsenic',  'O':'iodine',      'P':'silver',
-            'Q':'red',       'R':'sulfur',   'S':'purple',      'T':'olive',
-            'U':'palegreen', 'V':'green',    'W':'blue',        'X':'palecyan',
-            'Y':'limon',     'Z':'chocolate'}
 
-chainpairs=set()
-for chain1 in unique_chains:
-    for chain2 in unique_chains:
-        if chain1 >= chain2: continue
-        chainpairs.add(chain1 + "-" + chain2)
-
-OUT.write("\nChn1 Chn2  PAE Dist  Type   ipSAE    ipSAE_d0chn ipSAE_d0dom  ipTM_af  ipTM_d0chn     pDockQ     pDockQ2    LIS       n0res  n0chn  n0dom   d0res   d0chn   d0dom  nres1   nres2   dist1   dist2  Model\n")
-PML.write("# Chn1 Chn2  PAE Dist  Type   ipSAE    ipSAE_d0chn ipSAE_d0dom  ipTM_af  ipTM_d0chn     pDockQ     pDockQ2    LIS      n0res  n0chn  n0dom   d0res   d0chn   d0dom  nres1   nres2   dist1   dist2  Model\n")
-for pair in sorted(chainpairs):
-    (chain_a, chain_b) = pair.split("-")
-    pair1 = (chain_a, chain_b)
-    pair2 = (chain_b, chain_a)
-    for pair in (pair1, pair2):
-        chain1=pair[0]
-        chain2=pair[1]
-
-        if chain1 in chaincolor:
-            color1=chaincolor[chain1]
-        else:
-            color1='magenta'
+# Cutoff sweep table (_sweep.txt next to the structure file): the summary rows of every (pae_cutoff, dist_cutoff)
+# result under a single header; the PAE and Dist columns identify the cutoff pair of each row
+def write_sweep(results, pdb_path):
+    first = min(results)
+    pdb_stem, _ = output_stems(pdb_path, *first)
+    with open(pdb_stem + "_sweep.txt",'w') as OUT:
+        for key in sorted(results):
+            write_summary(results[key], OUT, None, pdb_stem, header=(key == first))
 
-        if chain2 in chaincolor:
-            color2=chaincolor[chain2]
-        else:
-            color2='marine'
-
-        residues_1 = len(unique_residues_chain1[chain1][chain2])
-        residues_2 = len(unique_residues_chain2[chain1][chain2])
-        dist_residues_1 = len(dist_unique_residues_chain1[chain1][chain2])
-        dist_residues_2 = len(dist_unique_residues_chain2[chain1][chain2])
-        pairs = valid_pair_counts[chain1][chain2]
-        dist_pairs = dist_valid_pair_counts[chain1][chain2]
-        if af2: iptm_af = iptm_af2  # same for all chain pairs in entry
-        if af3: iptm_af = iptm_af3[chain1][chain2]  # symmetric value for each chain pair
-        if boltz: iptm_af=iptm_boltz[chain1][chain2]
-
-        outstring=f'{chain1}    {chain2}     {pae_string:3}  {dist_string:3}  {"asym":5} ' + (
-            f'{ipsae_d0res_asym[chain1][chain2]:8.6f}    '
-            f'{ipsae_d0chn_asym[chain1][chain2]:8.6f}    '
-            f'{ipsae_d0dom_asym[chain1][chain2]:8.6f}    '
-            f'{iptm_af:5.3f}    '
-            f'{iptm_d0chn_asym[chain1][chain2]:8.6f}    '
-            f'{pDockQ[chain1][chain2]:8.4f}   '
-            f'{pDockQ2[chain1][chain2]:8.4f}   '
-            f'{LIS[chain1][chain2]:8.4f}   '
-            f'{int(n0res[chain1][chain2]):5d}  '
-            f'{int(n0chn[chain1][chain2]):5d}  '
-            f'{int(n0dom[chain1][chain2]):5d}  '
-            f'{d0res[chain1][chain2]:6.2f}  '
-            f'{d0chn[chain1][chain2]:6.2f}  '
-            f'{d0dom[chain1][chain2]:6.2f}  '
-            f'{residues_1:5d}   '
-            f'{residues_2:5d}   '
-            f'{dist_residues_1:5d}   '
-            f'{dist_residues_2:5d}   '
-            f'{pdb_stem}\n')
-        OUT.write(outstring)
-        PML.write("# " + outstring)
-        if chain1 > chain2:
-            residues_1 = max(len(unique_residues_chain2[chain1][chain2]), len(unique_residues_chain1[chain2][chain1]))
-            residues_2 = max(len(unique_residues_chain1[chain1][chain2]), len(unique_residues_chain2[chain2][chain1]))
-            dist_residues_1 = max(len(dist_unique_residues_chain2[chain1][chain2]), len(dist_unique_residues_chain1[chain2][chain1]))
-            dist_residues_2 = max(len(dist_unique_residues_chain1[chain1][chain2]), len(dist_unique_residues_chain2[chain2][chain1]))
-
-            iptm_af_value=iptm_af
-            pDockQ2_value=max(pDockQ2[chain1][chain2], pDockQ2[chain2][chain1])
-            if boltz:
-                iptm_af_value=max(iptm_boltz[chain1][chain2], iptm_boltz[chain2][chain1])
-
-
-            LIS_Score=(LIS[chain1][chain2]+LIS[chain2][chain1])/2.0
-            outstring=f'{chain2}    {chain1}     {pae_string:3}  {dist_string:3}  {"max":5} ' + (
-                f'{ipsae_d0res_max[chain1][chain2]:8.6f}    '
-                f'{ipsae_d0chn_max[chain1][chain2]:8.6f}    '
-                f'{ipsae_d0dom_max[chain1][chain2]:8.6f}    '
-                f'{iptm_af_value:5.3f}    '
-                f'{iptm_d0chn_max[chain1][chain2]:8.6f}    '
-                f'{pDockQ[chain1][chain2]:8.4f}   '
-                f'{pDockQ2_value:8.4f}   '
-                f'{LIS_Score:8.4f}   '
-                f'{int(n0res_max[chain1][chain2]):5d}  '
-                f'{int(n0chn[chain1][chain2]):5d}  '
-                f'{int(n0dom_max[chain1][chain2]):5d}  '
-                f'{d0res_max[chain1][chain2]:6.2f}  '
-                f'{d0chn[chain1][chain2]:6.2f}  '
-                f'{d0dom_max[chain1][chain2]:6.2f}  '
-                f'{residues_1:5d}   '
-                f'{residues_2:5d}   '
-                f'{dist_residues_1:5d}   '
-                f'{dist_residues_2:5d}   '
-                f'{pdb_stem}\n')
-            OUT.write(outstring)
-            PML.write("# " + outstring)
 
-        chain_pair= f'color_{chain1}_{chain2}'
-        chain1_residues = f'chain  {chain1} and resi {contiguous_ranges(unique_residues_chain1[chain1][chain2])}'
-        chain2_residues = f'chain  {chain2} and resi {contiguous_ranges(unique_residues_chain2[chain1][chain2])}'
-        PML.write(f'alias {chain_pair}, color gray80, all; color {color1}, {chain1_residues}; color {color2}, {chain2_residues}\n\n')
-    OUT.write("\n")
\ No newline at end of file
+def print_usage():
+    print("Usage for AF2 (PDB format):")
+    print("   python ipsae.py <path_to_pae_json_file> <path_to_pdb_file> <pae_cutoff> <dist_cutoff>")
+    print("   python ipsae.py RAF1_KSR1_scores_rank_001_alphafold2_multimer_v3_model_4_seed_003.json RAF1_KSR1_unrelaxed_rank_001_alphafold2_multimer_v3_model_4_seed_003.pdb 10 15")
+    print("")
+    print("Usage for AF3 (mmCIF format):")
+    print("   python ipsae.py <path_to_pae_json_file> <path_to_mmcif_file> <pae_cutoff> <dist_cutoff>")
+    print("   python ipsae.py fold_aurka_tpx2_full_data_0.json  fold_aurka_tpx2_model_0.cif 10 15")
+    print("")
+    print("Usage for Boltz (PDB or mmCIF format):")
+    print("   python ipsae.py <path_to_pae_npz_file> <path_to_mmcif_file> <pae_cutoff> <dist_cutoff>")
+    print("   python ipsae.py <path_to_pae_npz_file> <path_to_pdb_file> <pae_cutoff> <dist_cutoff>")
+    print("   python ipsae.py pae_AURKA_TPX2_model_0.npz  AURKA_TPX2_model_0.cif 10 15")
+    print("   python ipsae.py pae_AURKA_TPX2_model_0.npz  AURKA_TPX2_model_0.pdb 10 15")
+    print("")
+    print("Options (after the four arguments above):")
+    print("   --float32                compute in float32 (about half the memory)")
+    print("   --memory-budget <MB>     process chain blocks in row tiles that fit in <MB>; reports peak memory")
+    print("   --byres                  also write the per-residue _byres.txt file")
+    print("   --outputs <kinds>        comma-separated output files to write (default txt,pml):")
+    print("                            txt, pml, byres, json, parquet, arrow, byres_json, byres_parquet, byres_arrow")
+    print("                            (parquet and arrow need pyarrow)")
+    print("   --profile                print wall time, peak allocated memory and element counts for each stage")
+    print("   --profile-log <file>     append the stage record as one JSON line to <file> (implies --profile)")
+    print("")
+    print("Cutoff sweep: give comma-separated cutoffs to score every combination from one read of the model.")
+    print("The usual output files are written for each combination plus one table of all of them (_sweep.txt)")
+    print("   python ipsae.py fold_aurka_tpx2_full_data_0.json  fold_aurka_tpx2_model_0.cif 5,10,15 8,10,15")
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    # Ensure correct usage
+    if len(argv) < 5:
+        print_usage()
+        sys.exit(1)
+
+    pae_file_path =    argv[1]
+    pdb_path =         argv[2]
+    pae_cutoffs =      [float(value) for value in argv[3].split(",")]
+    dist_cutoffs =     [float(value) for value in argv[4].split(",")]
+    options =          argv[5:]
+    float32 =          "--float32" in options
+    memory_budget_mb = None
+    if "--memory-budget" in options:
+        memory_budget_mb = float(options[options.index("--memory-budget") + 1])
+    outputs = default_outputs
+    if "--outputs" in options:
+        outputs = tuple(options[options.index("--outputs") + 1].split(","))
+    if "--byres" in options and 'byres' not in outputs:
+        outputs = outputs + ('byres',)
+    profile_log = None
+    if "--profile-log" in options:
+        profile_log = options[options.index("--profile-log") + 1]
+    profile = ScoreProfile(pdb_path) if "--profile" in options or profile_log is not None else None
+
+    try:
+        check_output_kinds(outputs)
+        structure, pae = load_model(pae_file_path, pdb_path, float32=float32, profile=profile)
+    except (FileNotFoundError, ValueError, ImportError) as err:
+        print(err)
+        sys.exit()
+    results = score_sweep(structure, pae, pae_cutoffs, dist_cutoffs, float32=float32, memory_budget_mb=memory_budget_mb, profile=profile)
+
+    for result in results.values():
+        write_outputs(result, pdb_path, outputs, profile=profile)
+    if len(results) > 1:
+        write_sweep(results, pdb_path)
+    result = next(iter(results.values()))
+    if float32 or memory_budget_mb is not None:
+        peak = "n/a" if result.peak_memory_mb is None else f"{result.peak_memory_mb:.1f} MB"
+        process_peak = "n/a" if result.process_peak_memory_mb is None else f"{result.process_peak_memory_mb:.1f} MB"
+        print(f"tile rows: {result.tile_rows}   peak scoring memory: {peak}   process peak memory: {process_peak}")
+    if profile is not None:
+        for stage in profile.stages:
+            counts = "  ".join(f"{key}={value}" for key, value in stage.items() if key not in ('stage', 'seconds', 'peak_mb'))
+            peak = "n/a" if stage.get('peak_mb') is None else f"{stage['peak_mb']:.1f}"
+            print(f"{stage['stage']:20s} {stage['seconds']:8.3f} s  {peak:>9s} MB  {counts}")
+        if profile_log is not None:
+            profile.append_to(profile_log)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ importlib.reload(utils)
 import altair as alt
 import numpy as np
 import os
+import tempfile
 # from streamlit_gsheets import GSheetsConnection
 from datetime import datetime
 
@@ -22,6 +23,8 @@ st.title("Alphafold server tools")
 documentation_text ="""
 This tool converts your sequence data into the specific JSON format required for AlphaFold 3 server submissions. To use it, upload a CSV file containing prediction_id and sequence columns; any rows sharing the same ID will be grouped into a single multimer or protein-ligand prediction. The tool automatically divides your data into batches of 30 jobs per JSON file to stay within the server's daily upload limit. Once generated, you can download these batches individually or as a ZIP file and upload them directly to the [AlphaFold 3 Server](https://alphafoldserver.com/) to begin your predictions.
 
+For interaction screens, choose the Pairwise screen mode and upload one row per protein instead (for example the table from the genome file converter). Pick your baits, or all vs all, and the pairwise jobs are generated straight into a ZIP of batch files without building the pair table first.
+
 Happy Folding!
 """
 st.write(documentation_text)
@@ -81,6 +84,29 @@ uploaded_file = st.file_uploader("Upload your data (CSV or Excel)", type=["csv",
 # 1. Initialize session state for results if it doesn't exist
 if 'json_results' not in st.session_state:
     st.session_state.json_results = None
+if 'json_archive' not in st.session_state:
+    st.session_state.json_archive = None
+if 'generated_jobs' not in st.session_state:
+    st.session_state.generated_jobs = None
+# The job index of duplicate check belongs to the user: it lives in the session (as the bytes of the SQLite file)
+# and is uploaded and downloaded by the user, nothing is kept on the server
+if 'job_index' not in st.session_state:
+    st.session_state.job_index = None
+    st.session_state.job_index_upload = None
+
+
+def update_job_index(action):
+    """Runs action(index_path) on a temporary copy of the session's job index and keeps the updated index."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_path = os.path.join(tmp_dir, "fold_job_index.sqlite")
+        if st.session_state.job_index is not None:
+            with open(index_path, "wb") as f:
+                f.write(st.session_state.job_index)
+        result = action(index_path)
+        with open(index_path, "rb") as f:
+            st.session_state.job_index = f.read()
+    return result
+
 
 if uploaded_file:
     try:
@@ -137,32 +163,146 @@ if uploaded_file:
     except Exception as e:
         st.error(f"Error loading file: {e}")
 
-    # 2. When the button is clicked, save the output to session_state
-    if st.button("Generate JSON Batches"):
-        st.session_state.json_results = utils.create_alphafold_json_files_streamlit(selected_df)
-        st.success(f"Generated {len(st.session_state.json_results)} file(s)!")
+    # Job mode: the table holds the jobs themselves (rows grouped by prediction_id), or one row per molecule
+    # from which pairwise jobs are generated lazily and streamed into the batch files of a ZIP archive
+    job_mode = st.radio(
+        "Job mode",
+        ["Job table", "Pairwise screen"],
+        horizontal=True,
+        help="Pairwise screen: one row per molecule (prediction_id, sequence); every pair (all vs all) or every bait-prey pair becomes a job",
+    )
 
-    # 3. Always check if we have results in state. If yes, show the buttons.
-    if st.session_state.json_results:
-        st.divider()
-        st.subheader("Download Results")
-        
-        # Zip option
-        if len(st.session_state.json_results) > 1:
-            zip_data = utils.create_zip(st.session_state.json_results)
+    if job_mode == "Job table":
+        # Batches are written as compact JSON straight into one ZIP archive; the indented per-file downloads are
+        # only built on request, as they keep every batch in memory
+        individual_files = st.checkbox(
+            "Also offer each batch file for download",
+            value=False,
+            help="Keeps an indented copy of every batch file for individual downloads; not recommended for large job lists",
+        )
+
+        # Duplicate jobs (same molecules and copy numbers, in any chain order) are skipped: repeats within the table,
+        # and with the job index, jobs marked as submitted before or already folded
+        with st.expander("Duplicate check"):
+            check_duplicates = st.checkbox("Skip jobs that repeat an earlier job", value=False)
+            job_index_file = st.file_uploader(
+                "Job index from an earlier session (optional)",
+                type=["sqlite"],
+                help="The job index downloaded below; without it only repeats within this session are found",
+            )
+            if job_index_file is not None and st.session_state.job_index_upload != (job_index_file.name, job_index_file.size):
+                st.session_state.job_index = job_index_file.getvalue()
+                st.session_state.job_index_upload = (job_index_file.name, job_index_file.size)
+            folded_job_requests = st.file_uploader(
+                "Job requests of folded jobs to register (optional)",
+                type=["json"],
+                accept_multiple_files=True,
+                help="The fold_<job>_job_request.json files of jobs folded by the AlphaFold Server",
+            )
+
+        # Batches packed by estimated tokens (one batch per submission day) instead of a fixed 30 jobs per file
+        with st.expander("Batch planning"):
+            plan_batches = st.checkbox(
+                "Pack batches by estimated tokens",
+                value=False,
+                help="Rejects jobs over the token limit before upload and packs the others largest first into batches of at most 30 jobs and the daily token budget",
+            )
+            day_tokens = st.number_input("Daily token budget (0 = no limit)", min_value=0, value=0, step=1000)
+            max_job_tokens = st.number_input("Token limit per job", min_value=1, value=utils.alphafold_max_job_tokens, step=100)
+
+        # 2. When the button is clicked, save the output to session_state
+        if st.button("Generate JSON Batches"):
+            jobs_df = selected_df
+            if check_duplicates:
+                if folded_job_requests:
+                    job_requests = [(f.name, f.getvalue()) for f in folded_job_requests]
+                    update_job_index(lambda index_path: utils.register_folded_job_requests(job_requests, index_path))
+                jobs_df, duplicates_df = update_job_index(lambda index_path: utils.deduplicate_alphafold_jobs(selected_df, index_path))
+                if len(duplicates_df):
+                    st.warning(f"Skipped {len(duplicates_df)} duplicate job(s)")
+                    st.dataframe(duplicates_df, hide_index=True)
+
+            plan = None
+            if plan_batches:
+                plan = utils.plan_alphafold_batches(jobs_df, day_tokens=day_tokens or None, max_job_tokens=max_job_tokens)
+                rejected = plan[plan["status"] != "planned"]
+                if len(rejected):
+                    st.warning(f"Rejected {len(rejected)} job(s) over the token limits")
+                    st.dataframe(rejected, hide_index=True)
+
+            st.session_state.json_archive = utils.create_alphafold_zip_streamlit(jobs_df, plan=plan)
+            st.session_state.json_results = None
+            if individual_files:
+                st.session_state.json_results = utils.create_alphafold_json_files_streamlit(jobs_df, plan=plan)
+            st.success("Generated ZIP archive!")
+
+            # Kept until the batches are uploaded and marked as submitted in the job index
+            if plan is not None:
+                planned_ids = set(plan.loc[plan["status"] == "planned", "prediction_id"])
+                jobs_df = jobs_df[jobs_df["prediction_id"].astype(str).isin(planned_ids)]
+            st.session_state.generated_jobs = jobs_df
+
+        if check_duplicates and st.session_state.generated_jobs is not None:
+            if st.button("Mark generated jobs as submitted", help="Once the batches are uploaded: later jobs that repeat them are skipped"):
+                generated_jobs = st.session_state.generated_jobs
+                update_job_index(lambda index_path: utils.record_submitted_jobs(generated_jobs, index_path))
+                st.session_state.generated_jobs = None
+                st.success("Jobs marked as submitted, download the job index to keep them for a later session")
+
+        if check_duplicates and st.session_state.job_index is not None:
+            st.download_button(
+                label="Download job index",
+                data=st.session_state.job_index,
+                file_name="fold_job_index.sqlite",
+                mime="application/vnd.sqlite3"
+            )
+
+        if st.session_state.json_archive is not None:
+            st.divider()
+            st.session_state.json_archive.seek(0)
             st.download_button(
                 label="Download All as ZIP",
-                data=zip_data,
+                data=st.session_state.json_archive.read(),
                 file_name="alphafold_all_batches.zip",
                 mime="application/zip"
             )
 
-        # Individual files
-        for filename, json_str in st.session_state.json_results.items():
+        # 3. Always check if we have results in state. If yes, show the buttons.
+        if st.session_state.json_results:
+            st.subheader("Download Individual Files")
+
+            # Individual files
+            for filename, json_str in st.session_state.json_results.items():
+                st.download_button(
+                    label=f"Download {filename}",
+                    data=json_str,
+                    file_name=filename,
+                    mime="application/json",
+                    key=filename # Adding a unique key is good practice in loops
+                )
+
+    else:
+        if 'pairwise_zip' not in st.session_state:
+            st.session_state.pairwise_zip = None
+
+        all_vs_all = st.checkbox("All vs all", value=False)
+        bait_ids = [] if all_vs_all else st.multiselect("Baits", selected_df["prediction_id"].astype(str).unique())
+        include_self = st.checkbox("Include homodimers", value=False)
+        nmolecules = selected_df["prediction_id"].astype(str).nunique()
+        njobs = utils.count_pairwise_jobs(nmolecules, None if all_vs_all else len(bait_ids), include_self)
+        st.write(f"{njobs} jobs in {-(-njobs // 30)} batch file(s)")
+
+        if st.button("Generate pairwise JSON Batches", disabled=njobs == 0):
+            jobs = utils.iter_pairwise_jobs(selected_df, bait_ids=bait_ids, all_vs_all=all_vs_all, include_self=include_self, compact=True)
+            st.session_state.pairwise_zip = utils.create_zip_spooled(utils.iter_alphafold_batches(jobs, compact=True))
+            st.success(f"Generated {-(-njobs // 30)} file(s)!")
+
+        if st.session_state.pairwise_zip is not None:
+            st.divider()
+            st.session_state.pairwise_zip.seek(0)
             st.download_button(
-                label=f"Download {filename}",
-                data=json_str,
-                file_name=filename,
-                mime="application/json",
-                key=filename # Adding a unique key is good practice in loops
-            )
\ No newline at end of file
+                label="Download All as ZIP",
+                data=st.session_state.pairwise_zip.read(),
+                file_name="alphafold_pairwise_batches.zip",
+                mime="application/zip"
+            )
@@ -3,9 +3,15 @@ import pandas as pd
 import os, json
 import zipfile
 import io
+import tempfile
 from Bio import SeqIO
 import numpy as np
 import re
+import sqlite3
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat, islice
+import ipsae
 
 
 def create_alphafold_json_files(
@@ -87,6 +93,7 @@ def create_alphafold_json_files_streamlit(
     sequence_col_name="sequence",
     count_col_name='copies',
     type_col_name='entity_type',
+    plan=None,
 ):
     # df = df.copy()
     # if count_col is None:
@@ -103,73 +110,563 @@ def create_alphafold_json_files_streamlit(
         df (pd.DataFrame): DataFrame with columns ['jobid', 'sequence', 'count', 'type'].
         batch_size (int): Number of jobs per JSON file.
         output_prefix (str): Prefix for output file names.
+        plan (pd.DataFrame): Optional batch plan of df from plan_alphafold_batches; batch_size is then not used.
     """
-    df = df.copy()
+    columns = dict(prediction_id_col_name=prediction_id_col_name, sequence_col_name=sequence_col_name,
+                   count_col_name=count_col_name, type_col_name=type_col_name)
+    if plan is not None:
+        batches = iter_planned_batches(df, plan, output_prefix=output_prefix, **columns)
+    else:
+        batches = iter_alphafold_batches(iter_alphafold_jobs(df, **columns), batch_size=batch_size, output_prefix=output_prefix)
+
+    # Ensure output path exists
+    os.makedirs(output_repository_path, exist_ok=True)
+
+    # Instead of writing to disk, store in a dictionary
+    return dict(batches)
+
+
+def create_alphafold_zip_streamlit(
+    df,
+    batch_size=30,
+    output_prefix="alphafold_batch",
+    prediction_id_col_name="prediction_id",
+    sequence_col_name="sequence",
+    count_col_name='copies',
+    type_col_name='entity_type',
+    max_memory_mb=64,
+    plan=None,
+):
+    """
+    Same batches as create_alphafold_json_files_streamlit (fixed batch_size, or the batches of plan), as compact JSON
+    streamed batch by batch into a ZIP archive (see create_zip_spooled): no batch strings are kept, only the archive.
+
+    Returns:
+        archive (tempfile.SpooledTemporaryFile): The ZIP archive, positioned at the start.
+    """
+    columns = dict(prediction_id_col_name=prediction_id_col_name, sequence_col_name=sequence_col_name,
+                   count_col_name=count_col_name, type_col_name=type_col_name)
+    if plan is not None:
+        batches = iter_planned_batches(df, plan, output_prefix=output_prefix, compact=True, **columns)
+    else:
+        batches = iter_alphafold_batches(iter_alphafold_jobs(df, compact=True, **columns), batch_size=batch_size,
+                                         output_prefix=output_prefix, compact=True)
+    return create_zip_spooled(batches, max_memory_mb=max_memory_mb)
 
+
+def iter_alphafold_jobs(
+    df,
+    prediction_id_col_name="prediction_id",
+    sequence_col_name="sequence",
+    count_col_name='copies',
+    type_col_name='entity_type',
+    compact=False,
+):
+    """
+    Generates the formatted jobs of a job table (rows grouped by prediction_id, jobs sorted by prediction_id)
+    from its column arrays, one job at a time; compact=True leaves out the indentation.
+
+    Returns:
+        jobs (generator): Formatted jobs for iter_alphafold_batches.
+    """
+    jobids, job_rows, entity_types, sequences, counts = group_alphafold_jobs(
+        df, prediction_id_col_name=prediction_id_col_name, sequence_col_name=sequence_col_name,
+        count_col_name=count_col_name, type_col_name=type_col_name)
+
+    # Molecule entries and jobs are formatted as json.dumps(batch, indent=2) (or compact json.dumps) writes them
+    for jobid, rows in zip(jobids, job_rows):
+        yield format_alphafold_job(jobid, [format_alphafold_entry(entity_types[i], sequences[i], counts[i], compact) for i in rows], compact)
+
+
+def group_alphafold_jobs(
+    df,
+    prediction_id_col_name="prediction_id",
+    sequence_col_name="sequence",
+    count_col_name='copies',
+    type_col_name='entity_type',
+):
+    """
+    Column arrays of a job table and the rows of each job, without building per-row objects.
+
+    Returns:
+        jobids (pd.Index): The job names, sorted (as groupby sorts them; rows without a prediction_id are left out).
+        job_rows (list of list): Row positions of each job, in input order.
+        entity_types, sequences, counts (list): Mapped entity type, stripped sequence and copy number of each row.
+    """
     type_mapping = {
         'protein': 'proteinChain',
         'dna': 'dnaSequence',      # You can add others here too!
         'rna': 'rnaSequence',
     }
 
-    # Apply mapping. .get(x, x) ensures if it's not in the dict, it stays original
-    df[type_col_name] = df[type_col_name].apply(lambda x: type_mapping.get(x, x))
+    # Column arrays; .get(x, x) ensures if it's not in the dict, it stays original
+    entity_types = [type_mapping.get(x, x) for x in df[type_col_name].tolist()]
+    sequences = [str(x).strip() for x in df[sequence_col_name].tolist()]
+    counts = [int(x) for x in df[count_col_name].tolist()]
 
-    # Group by jobid
-    grouped = df.groupby(prediction_id_col_name)
+    # Group by jobid: rows of each job (sorted like groupby, rows in input order) are order[offsets[n]:offsets[n+1]]
+    codes, jobids = pd.factorize(df[prediction_id_col_name], sort=True)
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    offsets = np.searchsorted(codes[order], np.arange(len(jobids) + 1)).tolist()
+    order = order.tolist()
+    job_rows = [order[offsets[n]:offsets[n + 1]] for n in range(len(jobids))]
+    return jobids, job_rows, entity_types, sequences, counts
 
 
-    jobs = []
-    for jobid, group in grouped:
-        molecule_list = []
-        for _, molecule in group.iterrows():
-            entity_type = molecule[type_col_name]
-            val = str(molecule[sequence_col_name]).strip()
-            count = int(molecule[count_col_name])
-            print(molecule)
-            if molecule[type_col_name] == 'CCD_OLA':
-                entry = {
-                    "ligand": {
-                        "ligand": entity_type,
-                        "count": count
-                    }
-                }
-            else:
-                entry = {
-                    entity_type: {
-                        "sequence": val,
-                        "count": count
-                    }
-                }
-            molecule_list.append(entry)
+# AlphaFold Server molecule types that name the same kind of entity
+alphafold_type_aliases = {'dnaChain': 'dnaSequence', 'rnaChain': 'rnaSequence'}
 
-        job = {
-                    "name": str(jobid),
-                    "modelSeeds": [], # AF3 usually expects at least one seed
-                    "sequences": molecule_list,
-                    "dialect": "alphafoldserver",
-                    "version": 1
-                }
-        jobs.append(job)
 
-    # Ensure output path exists
-    os.makedirs(output_repository_path, exist_ok=True)
+def canonical_job_hash(molecules):
+    """
+    Hash of the contents of a fold job that does not depend on its name or on the order of its chains.
+    molecules is a list of (entity type, sequence or CCD code, count); identical molecules are merged by
+    adding their counts, then the sorted list is hashed with SHA-256. Other entry fields (templates,
+    modifications) are not part of the hash.
 
-    # Instead of writing to disk, store in a dictionary
-    output_files = {}
-    for i in range(0, len(jobs), batch_size):
-        batch = jobs[i:i + batch_size]
-        filename = f"{output_prefix}_{i // batch_size + 1}.json"
-        output_files[filename] = json.dumps(batch, indent=2)
-    
-    return output_files
+    Returns:
+        job_hash (str): Hexadecimal SHA-256 digest.
+    """
+    counts = {}
+    for entity_type, value, count in molecules:
+        key = (alphafold_type_aliases.get(entity_type, entity_type), str(value).strip())
+        counts[key] = counts.get(key, 0) + int(count)
+    canonical = sorted([entity_type, value, count] for (entity_type, value), count in counts.items())
+    return hashlib.sha256(json.dumps(canonical).encode()).hexdigest()
+
+
+def job_request_molecules(job):
+    """(entity type, sequence or CCD code, count) of each entry of an AlphaFold Server job dict (job_request.json format)."""
+    molecules = []
+    for entry in job.get('sequences', []):
+        for entity_type, fields in entry.items():
+            value = fields.get('sequence', fields.get('ligand', fields.get('ion')))
+            molecules.append((entity_type, value, fields.get('count', 1)))
+    return molecules
+
+
+def get_alphafold_job_hashes(
+    df,
+    prediction_id_col_name="prediction_id",
+    sequence_col_name="sequence",
+    count_col_name='copies',
+    type_col_name='entity_type',
+):
+    """
+    Canonical hash (canonical_job_hash) of each job of a job table, as the job JSON generator would write it.
+
+    Returns:
+        hashes_df (pd.DataFrame): prediction_id and job_hash of each job, in job order.
+    """
+    jobids, job_rows, entity_types, sequences, counts = group_alphafold_jobs(
+        df, prediction_id_col_name=prediction_id_col_name, sequence_col_name=sequence_col_name,
+        count_col_name=count_col_name, type_col_name=type_col_name)
+    hashes = [canonical_job_hash([('ligand', entity_types[i], counts[i]) if entity_types[i] == 'CCD_OLA' else
+                                  (entity_types[i], sequences[i], counts[i]) for i in rows]) for rows in job_rows]
+    return pd.DataFrame({'prediction_id': [str(jobid) for jobid in jobids], 'job_hash': hashes})
+
+
+def deduplicate_alphafold_jobs(
+    df,
+    index_path=None,
+    prediction_id_col_name="prediction_id",
+    sequence_col_name="sequence",
+    count_col_name='copies',
+    type_col_name='entity_type',
+):
+    """
+    Drops the jobs of a job table whose contents (canonical_job_hash) repeat a job seen before: an earlier job of
+    the table (in prediction_id order) or, with index_path, a job already folded or submitted under another
+    prediction_id (see record_submitted_jobs and register_folded_jobs). A job submitted under its own
+    prediction_id is not a duplicate of itself, so the same table can be generated again.
+    Folded jobs are preferred as the job a duplicate links to.
+
+    Returns:
+        unique_df (pd.DataFrame): The rows of the jobs to keep.
+        duplicates_df (pd.DataFrame): prediction_id, job_hash, duplicate_of, status ('upload', 'submitted' or
+        'folded') and location (job folder of a folded job) of each dropped job.
+    """
+    hashes_df = get_alphafold_job_hashes(df, prediction_id_col_name=prediction_id_col_name, sequence_col_name=sequence_col_name,
+                                         count_col_name=count_col_name, type_col_name=type_col_name)
+    # indexed jobs of each hash, folded jobs first, then in the order they were added
+    known = {}
+    if index_path is not None:
+        connection = open_structome_index(index_path)
+        try:
+            for job_hash, prediction_id, status, location in connection.execute(
+                    "SELECT job_hash, prediction_id, status, location FROM fold_jobs ORDER BY status != 'folded', rowid"):
+                known.setdefault(job_hash, []).append((prediction_id, status, location))
+        finally:
+            connection.close()
+
+    duplicates = []
+    for prediction_id, job_hash in zip(hashes_df['prediction_id'], hashes_df['job_hash']):
+        matches = [match for match in known.get(job_hash, []) if not (match[1] == 'submitted' and match[0] == prediction_id)]
+        if matches:
+            duplicate_of, status, location = matches[0]
+            duplicates.append({'prediction_id': prediction_id, 'job_hash': job_hash, 'duplicate_of': duplicate_of,
+                               'status': status, 'location': location})
+        else:
+            known.setdefault(job_hash, []).append((prediction_id, 'upload', None))
+
+    duplicates_df = pd.DataFrame(duplicates, columns=['prediction_id', 'job_hash', 'duplicate_of', 'status', 'location'])
+    unique_df = df[~df[prediction_id_col_name].astype(str).isin(set(duplicates_df['prediction_id']))]
+    return unique_df, duplicates_df
+
+
+def record_submitted_jobs(
+    df,
+    index_path,
+    prediction_id_col_name="prediction_id",
+    sequence_col_name="sequence",
+    count_col_name='copies',
+    type_col_name='entity_type',
+):
+    """
+    Adds the jobs of a job table to the index at index_path as submitted, for deduplicate_alphafold_jobs.
+    Call it once the batches have actually been uploaded, not when they are generated.
+    """
+    hashes_df = get_alphafold_job_hashes(df, prediction_id_col_name=prediction_id_col_name, sequence_col_name=sequence_col_name,
+                                         count_col_name=count_col_name, type_col_name=type_col_name)
+    connection = open_structome_index(index_path)
+    try:
+        with connection:
+            connection.executemany("INSERT OR IGNORE INTO fold_jobs VALUES (?, ?, 'submitted', NULL)",
+                                   zip(hashes_df['job_hash'], hashes_df['prediction_id']))
+    finally:
+        connection.close()
+
+
+def register_folded_jobs(AF_structure_repository_path, index_path):
+    """
+    Adds the AlphaFold Server jobs of a structome directory (fold_<job>_job_request.json in each job folder) to the
+    index at index_path as folded, for deduplicate_alphafold_jobs. Folders already registered are not read again.
+
+    Returns:
+        nregistered (int): Number of job folders added.
+    """
+    connection = open_structome_index(index_path)
+    nregistered = 0
+    try:
+        with connection:
+            registered = {location for (location,) in connection.execute("SELECT location FROM fold_jobs WHERE status = 'folded'")}
+            with os.scandir(AF_structure_repository_path) as entries:
+                for entry in entries:
+                    job_path = os.path.abspath(entry.path)
+                    if not entry.is_dir() or job_path in registered:
+                        continue
+                    job_request_path = os.path.join(job_path, f'fold_{entry.name}_job_request.json')
+                    if not os.path.exists(job_request_path):
+                        continue
+                    try:
+                        with open(job_request_path, 'r') as f:
+                            job_request = json.load(f)
+                    except ValueError as e:
+                        print(f"Warning: could not read '{job_request_path}': {e}. Skipping...")
+                        continue
+                    insert_folded_jobs(connection, job_request, entry.name, job_path)
+                    nregistered += 1
+    finally:
+        connection.close()
+    return nregistered
+
+
+def register_folded_job_requests(job_requests, index_path):
+    """
+    Adds folded AlphaFold Server jobs given as job_request.json contents (e.g. uploaded files) to the index at
+    index_path, for deduplicate_alphafold_jobs. job_requests holds (filename, content) pairs; the filename is
+    stored as the location of the jobs.
+
+    Returns:
+        nregistered (int): Number of job_request files added (unreadable files are skipped).
+    """
+    connection = open_structome_index(index_path)
+    nregistered = 0
+    try:
+        with connection:
+            for filename, content in job_requests:
+                try:
+                    job_request = json.loads(content)
+                except ValueError as e:
+                    print(f"Warning: could not read '{filename}': {e}. Skipping...")
+                    continue
+                insert_folded_jobs(connection, job_request, filename, filename)
+                nregistered += 1
+    finally:
+        connection.close()
+    return nregistered
+
+
+def insert_folded_jobs(connection, job_request, default_name, location):
+    for job in job_request if isinstance(job_request, list) else [job_request]:
+        connection.execute("INSERT OR IGNORE INTO fold_jobs VALUES (?, ?, 'folded', ?)",
+                           (canonical_job_hash(job_request_molecules(job)), job.get('name', default_name), location))
+
+
+def format_alphafold_entry(entity_type, sequence, count, compact=False):
+    encode = json.encoder.encode_basestring_ascii
+    if entity_type == 'CCD_OLA':
+        return alphafold_formats[compact]['ligand_entry'] % (encode(entity_type), count)
+    return alphafold_formats[compact]['entry'] % (encode(entity_type), encode(sequence), count)
+
+
+def format_alphafold_job(jobid, entries, compact=False):
+    return alphafold_formats[compact]['job'] % (json.encoder.encode_basestring_ascii(str(jobid)), ("," if compact else ",\n").join(entries))
+
+
+def iter_alphafold_batches(jobs, batch_size=30, output_prefix="alphafold_batch", compact=False):
+    """
+    Groups formatted jobs (format_alphafold_job, with the same compact setting) into AlphaFold Server batch files,
+    lazily: jobs can be any iterable (e.g. iter_pairwise_jobs) and only one batch is held at a time.
+
+    Returns:
+        batches (generator): (filename, json_str) for each batch file, numbered from 1.
+    """
+    jobs = iter(jobs)
+    batch_nr = 1
+    while True:
+        batch = list(islice(jobs, batch_size))
+        if not batch:
+            return
+        yield f"{output_prefix}_{batch_nr}.json", format_alphafold_batch(batch, compact)
+        batch_nr += 1
+
+
+def format_alphafold_batch(jobs, compact=False):
+    if compact:
+        return "[" + ",".join(jobs) + "]"
+    return "[\n" + ",\n".join(jobs) + "\n]"
+
+
+# AlphaFold Server limit on the tokens of one job, and the molecule types counted as one token per residue
+alphafold_max_job_tokens = 5000
+alphafold_chain_types = {'proteinChain', 'dnaSequence', 'rnaSequence', 'dnaChain', 'rnaChain'}
+
+
+def plan_alphafold_batches(
+    df,
+    batch_size=30,
+    day_tokens=None,
+    max_job_tokens=alphafold_max_job_tokens,
+    ligand_tokens=30,
+    prediction_id_col_name="prediction_id",
+    sequence_col_name="sequence",
+    count_col_name='copies',
+    type_col_name='entity_type',
+):
+    """
+    Plans the batch files (one per submission day) of a job table. The tokens of a job are estimated as sequence length
+    x count for protein/DNA/RNA chains and ligand_tokens x count for ligands. Jobs over max_job_tokens (the server
+    limit), or over day_tokens on their own, are rejected up front. The other jobs are packed first-fit-decreasing
+    (largest first, each into the first batch with room) into batches of at most batch_size jobs and, with
+    day_tokens set, at most day_tokens tokens, so the number of batches (days) stays small.
+
+    Returns:
+        plan (pd.DataFrame): prediction_id, tokens, batch (1, 2, ...; 0 for rejected jobs) and status ('planned',
+        'over_job_limit' or 'over_day_budget') of each job, in job order (pass it to create_alphafold_json_files_streamlit).
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, not {batch_size}")
+    jobids, job_rows, entity_types, sequences, counts = group_alphafold_jobs(
+        df, prediction_id_col_name=prediction_id_col_name, sequence_col_name=sequence_col_name,
+        count_col_name=count_col_name, type_col_name=type_col_name)
+
+    row_tokens = [count * (len(sequence) if entity_type in alphafold_chain_types else ligand_tokens)
+                  for entity_type, sequence, count in zip(entity_types, sequences, counts)]
+    tokens = np.array([sum(row_tokens[i] for i in rows) for rows in job_rows], dtype=np.int64)
+
+    status = np.full(len(jobids), 'planned', dtype=object)
+    if max_job_tokens is not None:
+        status[tokens > max_job_tokens] = 'over_job_limit'
+    if day_tokens is not None:
+        status[(status == 'planned') & (tokens > day_tokens)] = 'over_day_budget'
+
+    # first-fit decreasing; batches that are full (jobs) or cannot take even the smallest job (tokens) are closed
+    batch = np.zeros(len(jobids), dtype=np.int64)
+    planned = np.flatnonzero(status == 'planned')
+    order = planned[np.argsort(-tokens[planned], kind='stable')]
+    smallest = tokens[planned].min() if len(planned) else 0
+    open_batches = []  # [batch number, number of jobs, tokens]
+    nbatches = 0
+    for n in order.tolist():
+        job_tokens = int(tokens[n])
+        for open_batch in open_batches:
+            if day_tokens is None or open_batch[2] + job_tokens <= day_tokens:
+                break
+        else:
+            nbatches += 1
+            open_batch = [nbatches, 0, 0]
+            open_batches.append(open_batch)
+        batch[n] = open_batch[0]
+        open_batch[1] += 1
+        open_batch[2] += job_tokens
+        if open_batch[1] >= batch_size or (day_tokens is not None and open_batch[2] + smallest > day_tokens):
+            open_batches.remove(open_batch)
+
+    return pd.DataFrame({'prediction_id': [str(jobid) for jobid in jobids], 'tokens': tokens, 'batch': batch, 'status': status})
+
+
+def iter_planned_batches(
+    df,
+    plan,
+    output_prefix="alphafold_batch",
+    compact=False,
+    prediction_id_col_name="prediction_id",
+    sequence_col_name="sequence",
+    count_col_name='copies',
+    type_col_name='entity_type',
+):
+    """
+    Batch files of a job table following a plan from plan_alphafold_batches, formatted one batch at a time;
+    rejected jobs are left out and the jobs of a batch keep the job order.
+
+    Returns:
+        batches (generator): (filename, json_str) for each planned batch, in batch order.
+    """
+    jobids, job_rows, entity_types, sequences, counts = group_alphafold_jobs(
+        df, prediction_id_col_name=prediction_id_col_name, sequence_col_name=sequence_col_name,
+        count_col_name=count_col_name, type_col_name=type_col_name)
+    if plan['prediction_id'].tolist() != [str(jobid) for jobid in jobids]:
+        raise ValueError("The batch plan does not match the jobs of the table; plan it again with plan_alphafold_batches")
+
+    batch = plan['batch'].to_numpy()
+    for batch_nr in np.unique(batch[batch > 0]).tolist():
+        jobs = [format_alphafold_job(jobids[n], [format_alphafold_entry(entity_types[i], sequences[i], counts[i], compact) for i in job_rows[n]], compact)
+                for n in np.flatnonzero(batch == batch_nr).tolist()]
+        yield f"{output_prefix}_{batch_nr}.json", format_alphafold_batch(jobs, compact)
+
+
+# One job of an AlphaFold Server batch file and its molecule entries, indented as in json.dumps(batch, indent=2)
+alphafold_job_format = """  {
+    "name": %s,
+    "modelSeeds": [],
+    "sequences": [
+%s
+    ],
+    "dialect": "alphafoldserver",
+    "version": 1
+  }"""
+alphafold_entry_format = """      {
+        %s: {
+          "sequence": %s,
+          "count": %d
+        }
+      }"""
+alphafold_ligand_entry_format = """      {
+        "ligand": {
+          "ligand": %s,
+          "count": %d
+        }
+      }"""
+# the same without whitespace, as json.dumps(batch, separators=(',', ':')) writes them
+alphafold_formats = {
+    False: {'job': alphafold_job_format, 'entry': alphafold_entry_format, 'ligand_entry': alphafold_ligand_entry_format},
+    True:  {'job': '{"name":%s,"modelSeeds":[],"sequences":[%s],"dialect":"alphafoldserver","version":1}',
+            'entry': '{%s:{"sequence":%s,"count":%d}}',
+            'ligand_entry': '{"ligand":{"ligand":%s,"count":%d}}'},
+}
+
+
+def iter_pairwise_jobs(
+    df,
+    bait_ids=None,
+    all_vs_all=False,
+    include_self=False,
+    separator="_",
+    prediction_id_col_name="prediction_id",
+    sequence_col_name="sequence",
+    type_col_name='entity_type',
+    compact=False,
+):
+    """
+    Generates pairwise AlphaFold Server jobs from a list of molecules (one row per protein, e.g. from
+    gbk_to_dataframe_streamlit), one pair at a time, so an interaction screen never exists as a pair table.
+    With all_vs_all every unordered pair is a job; otherwise each bait in bait_ids is paired with every
+    molecule (pairs of two baits only once). include_self adds the homodimer of each molecule (or bait).
+    The job name is the two prediction ids joined by separator; type_col_name is optional (default protein).
+    Rows repeating a prediction id are dropped (the first row is kept). compact=True leaves out the indentation.
+
+    Returns:
+        jobs (generator): Formatted jobs for iter_alphafold_batches.
+    """
+    if not all_vs_all and not bait_ids:
+        raise ValueError("Pairwise jobs need bait_ids or all_vs_all=True")
+    type_mapping = {
+        'protein': 'proteinChain',
+        'dna': 'dnaSequence',
+        'rna': 'rnaSequence',
+    }
+
+    ids = [str(x) for x in df[prediction_id_col_name].tolist()]
+    sequences = [str(x).strip() for x in df[sequence_col_name].tolist()]
+    if type_col_name in df.columns:
+        entity_types = [type_mapping.get(x, x) for x in df[type_col_name].tolist()]
+    else:
+        entity_types = ['proteinChain'] * len(ids)
+    first_rows = sorted({prediction_id: i for i, prediction_id in reversed(list(enumerate(ids)))}.values())
+    if len(first_rows) < len(ids):
+        ids = [ids[i] for i in first_rows]
+        sequences = [sequences[i] for i in first_rows]
+        entity_types = [entity_types[i] for i in first_rows]
+
+    def job(i, j):
+        if i == j:
+            return format_alphafold_job(ids[i] + separator + ids[i], [format_alphafold_entry(entity_types[i], sequences[i], 2, compact)], compact)
+        return format_alphafold_job(ids[i] + separator + ids[j], [format_alphafold_entry(entity_types[i], sequences[i], 1, compact),
+                                                                  format_alphafold_entry(entity_types[j], sequences[j], 1, compact)], compact)
+
+    if all_vs_all:
+        for i in range(len(ids)):
+            if include_self:
+                yield job(i, i)
+            for j in range(i + 1, len(ids)):
+                yield job(i, j)
+        return
+
+    position = {prediction_id: i for i, prediction_id in enumerate(ids)}
+    missing = [bait for bait in bait_ids if str(bait) not in position]
+    if missing:
+        raise ValueError(f"Baits not in the molecule list: {', '.join(map(str, missing))}")
+    baits = list(dict.fromkeys(position[str(bait)] for bait in bait_ids))
+    bait_rank = {i: rank for rank, i in enumerate(baits)}
+    for rank, i in enumerate(baits):
+        if include_self:
+            yield job(i, i)
+        for j in range(len(ids)):
+            if j != i and bait_rank.get(j, len(baits)) > rank:
+                yield job(i, j)
+
+
+def count_pairwise_jobs(nmolecules, nbaits=None, include_self=False):
+    """Number of jobs iter_pairwise_jobs generates for nmolecules distinct molecules and nbaits distinct baits (None: all vs all)."""
+    if nbaits is None:
+        return nmolecules * (nmolecules - 1) // 2 + (nmolecules if include_self else 0)
+    return nbaits * (nmolecules - 1) - nbaits * (nbaits - 1) // 2 + (nbaits if include_self else 0)
+
+
+def create_zip_spooled(files, max_memory_mb=64):
+    """
+    Streams (filename, content) pairs, e.g. from iter_alphafold_batches, into a ZIP archive that stays in memory up to
+    max_memory_mb and moves to a temporary file beyond that. Each content is compressed as soon as it is produced.
+
+    Returns:
+        archive (tempfile.SpooledTemporaryFile): The ZIP archive, positioned at the start.
+    """
+    archive = tempfile.SpooledTemporaryFile(max_size=max_memory_mb * 1024**2)
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for filename, content in files:
+            zip_file.writestr(filename, content)
+    archive.seek(0)
+    return archive
 
 
 def create_zip(files_dict):
-    """Bundles the JSON strings into a single ZIP file in memory."""
+    """Bundles the JSON strings (a dict, or an iterable of (filename, content) pairs such as iter_alphafold_batches) into a single ZIP file in memory."""
     zip_buffer = io.BytesIO()
+    files = files_dict.items() if isinstance(files_dict, dict) else files_dict
     with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for filename, content in files_dict.items():
+        for filename, content in files:
             zip_file.writestr(filename, content)
     return zip_buffer.getvalue()
 
@@ -278,6 +775,56 @@ def get_AF3_summary_confidence_files(AF_prediction_path, title):
     ]
     return summary_confidence_files
 
+confidence_columns = ['prediction_id', 'model_nr', 'filename', 'iptm', 'ptm', 'ranking_score', 'chain_ptm', 'chain_iptm']
+
+
+def get_model_confidences(model_repository_path, model_repository_name, model='AF3'):
+    """
+    Reads the summary confidences of every model of one prediction folder.
+
+    Returns:
+        rows (list of dict): One row per model with the confidence_columns, sorted by model number
+        (the N of the summary_confidences_N.json file name).
+    """
+    rows = []
+    for confidence_filename in get_AF3_summary_confidence_files(model_repository_path, model_repository_name):
+        model_nr = int(re.search(r'_(\d+)\.json$', confidence_filename).group(1))
+        full_json_path = os.path.join(model_repository_path, confidence_filename)
+        iptm, ptm, ranking_score, chain_ptm, chain_iptm = get_summary_confidence_informations(full_json_path, model=model)
+        rows.append({'prediction_id': model_repository_name, 'model_nr': model_nr, 'filename': confidence_filename,
+                     'iptm': iptm, 'ptm': ptm, 'ranking_score': ranking_score,
+                     'chain_ptm': chain_ptm, 'chain_iptm': chain_iptm})
+    return sorted(rows, key=lambda row: row['model_nr'])
+
+
+def get_cif_filename(model_repository_name, model_nr, model='AF3'):
+    if model == 'AF3':
+        return 'fold_' + model_repository_name + '_model_' + str(model_nr) + '.cif'
+    elif (model == 'boltz1'):
+        return 'abc_' + model_repository_name + '_mmseqs_model_' + str(model_nr) + '.cif'
+    elif (model == 'chai1'):
+        return 'pred.model_idx_' +  str(model_nr) + '.cif'
+
+
+def select_best_models(confidence_df, AF_structure_repository_path, sort_by='ranking_score', model='AF3'):
+    """
+    Picks the best model of every prediction from a flat all-models table (get_structome_confidence_table)
+    with one grouped idxmax: the highest sort_by value, the first listed model on ties.
+    Any confidence column can be used for sort_by without reading the files again.
+
+    Returns:
+        AF_repository_metadata (pd.DataFrame): prediction_id, model_nr, iptm, ptm, ranking_score, chain_ptm,
+        chain_iptm, cif_filepath and cif_filename of the best model of each prediction.
+    """
+    ranked = confidence_df.dropna(subset=[sort_by])
+    best = ranked.loc[ranked.groupby('prediction_id', sort=True)[sort_by].idxmax()].reset_index(drop=True)
+    best['cif_filename'] = [get_cif_filename(prediction_id, model_nr, model=model)
+                            for prediction_id, model_nr in zip(best['prediction_id'], best['model_nr'])]
+    best['cif_filepath'] = [os.path.join(AF_structure_repository_path, prediction_id, cif_filename)
+                            for prediction_id, cif_filename in zip(best['prediction_id'], best['cif_filename'])]
+    return best[['prediction_id', 'model_nr', 'iptm', 'ptm', 'ranking_score', 'chain_ptm', 'chain_iptm', 'cif_filepath', 'cif_filename']]
+
+
 def get_best_AF3_model_info(model_repository_path, model_repository_name, sort_by = 'ranking_score', model='AF3'): 
     """
     Returns:
@@ -291,99 +838,308 @@ def get_best_AF3_model_info(model_repository_path, model_repository_name, sort_b
         # print('been here')
         print(f"Warning: Model repository path '{model_repository_path}' does not exist. Skipping...")
         return '', None, None, None, None, None, None
-    
-    
-    confidence_filename_list = get_AF3_summary_confidence_files(model_repository_path, model_repository_name)
-        # confidence_filename_list = get_chai_summary_confidence_files(model_repository_path, model_repository_name)
-    
-    iptm_array = []
-    ranking_score_array = []
-    ptm_array = []
-    model_nr_array = []
-    chain_ptm_array = []
-    chain_iptm_array = []
-    for ii in range(len(confidence_filename_list)): 
-        model_nr_array += [ii]
-        confidence_filename = confidence_filename_list[ii]
-        full_json_path = os.path.join(model_repository_path, confidence_filename)
-        iptm, ptm, ranking_score, chain_ptm, chain_iptm = get_summary_confidence_informations(full_json_path, model=model)
-        # iptm, ptm, ranking_score,chain_ptm, chain_iptm = get_summary_confidence_informations(model_repository_path + confidence_filename, model = model)
-        iptm_array += [iptm]
-        ptm_array += [ptm]
-        ranking_score_array += [ranking_score]
-        chain_ptm_array += [chain_ptm]
-        chain_iptm_array += [chain_iptm]
-    confidence_df = pd.DataFrame({'filename': confidence_filename_list,
-                'model_nr': model_nr_array,
-                 'iptm': iptm_array,
-                 'ptm': ptm_array,
-                 'ranking_score': ranking_score_array,
-                'chain_ptm': chain_ptm_array,
-                'chain_iptm': chain_iptm_array})
-    ranked_confidence_df = confidence_df.copy().sort_values(sort_by, ascending = False).reset_index(drop = True)
-    best_row = ranked_confidence_df.iloc[0]
-    best_model_nr = best_row['model_nr']
-    best_iptm = best_row['iptm']
-    best_ptm = best_row['ptm']
-    best_ranking_score = best_row['ranking_score']
-    best_chain_ptm = best_row['chain_ptm']
-    best_chain_iptm = best_row['chain_iptm']
-    if model == 'AF3':
-        best_cif_filename = 'fold_' + model_repository_name + '_model_' + str(best_model_nr) + '.cif'
-    elif (model == 'boltz1'):
-        best_cif_filename = 'abc_' + model_repository_name + '_mmseqs_model_' + str(best_model_nr) + '.cif'
-    elif (model == 'chai1'):
-        best_cif_filename = 'pred.model_idx_' +  str(best_model_nr) + '.cif'
 
-    return best_cif_filename, best_model_nr, best_iptm, best_ptm, best_ranking_score,best_chain_ptm,best_chain_iptm
+    confidence_df = pd.DataFrame(get_model_confidences(model_repository_path, model_repository_name, model=model), columns=confidence_columns)
+    best = select_best_models(confidence_df, os.path.dirname(model_repository_path), sort_by=sort_by, model=model)
+    if best.empty:
+        print(f"Warning: no summary confidence files in '{model_repository_path}'. Skipping...")
+        return '', None, None, None, None, None, None
+    best_row = best.iloc[0]
+    return (best_row['cif_filename'], best_row['model_nr'], best_row['iptm'], best_row['ptm'], best_row['ranking_score'],
+            best_row['chain_ptm'], best_row['chain_iptm'])
 
 
-def get_structome_best_model_metadata(AF_structure_repository_path, model = 'AF3'): 
-    prediction_names_list = [
-        d for d in os.listdir(AF_structure_repository_path) 
-        if os.path.isdir(os.path.join(AF_structure_repository_path, d))
-    ] #only the ones that are directories
-    cif_filename_array = []
-    iptm_array = []
-    ptm_array = []
-    ranking_score_array = []
-    chain_ptm_array = []
-    chain_iptm_array = []
-    cif_filepath_array = []
-    prediction_type_array = []
-    
-    for ii in range(len(prediction_names_list)): 
-        prediction_name = prediction_names_list[ii]
+def get_structome_confidence_table(AF_structure_repository_path, model = 'AF3'):
+    """
+    Reads the summary confidences of all models of all prediction folders in one pass.
 
+    Returns:
+        confidence_df (pd.DataFrame): One row per model with the confidence_columns, sorted by prediction and model number.
+    """
+    prediction_names_list = sorted(
+        d for d in os.listdir(AF_structure_repository_path)
+        if os.path.isdir(os.path.join(AF_structure_repository_path, d))
+    ) #only the ones that are directories
+    rows = []
+    for prediction_name in prediction_names_list:
         prediction_repository = os.path.join(AF_structure_repository_path, prediction_name)
+        rows += get_model_confidences(prediction_repository, prediction_name, model=model)
+    return pd.DataFrame(rows, columns=confidence_columns)
 
 
-            # prediction_repository = AF_structure_repository_path + prediction_name + '/'
-        cif_filename, best_model_nr, best_iptm, best_ptm, best_ranking_score,best_chain_ptm, best_chain_iptm =get_best_AF3_model_info(prediction_repository,prediction_name, model = model)
-        cif_filepath_array += [os.path.join(prediction_repository, cif_filename)]
-        cif_filename_array += [cif_filename]
-        iptm_array += [best_iptm]
-        ptm_array += [best_iptm]
-        ranking_score_array += [best_ranking_score]
-        chain_ptm_array += [best_chain_ptm]
-        chain_iptm_array += [best_chain_iptm]
-        prediction_type_array += [model]
-    
-    AF_repository_metadata = pd.DataFrame({'prediction_id': prediction_names_list,
-                    'cif_filename': cif_filename_array,
-                    'cif_filepath': cif_filepath_array,
-                                           'iptm': iptm_array,
-                                          'ptm': ptm_array,
-                                          'ranking_score': ranking_score_array,
-                                          'chain_ptm': chain_ptm_array,
-                                          'chain_iptm': chain_iptm_array,
-                                          'prediction_type': prediction_type_array
-                                          })
-    AF_repository_metadata['filepath'] = (
-        AF_structure_repository_path +
-        AF_repository_metadata['prediction_id'].astype(str) + '/' +
-        AF_repository_metadata['cif_filename'].astype(str)
-    )
+def get_structome_best_model_metadata(AF_structure_repository_path, model = 'AF3', sort_by = 'ranking_score'): 
+    """
+    Best model of every prediction folder (see select_best_models); folders without summary confidence files are left out.
+    To rank by several metrics, read get_structome_confidence_table once and call select_best_models for each.
+
+    Returns:
+        AF_repository_metadata (pd.DataFrame): prediction_id, iptm, ptm, chain_ptm, chain_iptm, cif_filepath and cif_filename.
+    """
+    confidence_df = get_structome_confidence_table(AF_structure_repository_path, model=model)
+    AF_repository_metadata = select_best_models(confidence_df, AF_structure_repository_path, sort_by=sort_by, model=model)
     AF_repository_metadata = AF_repository_metadata[['prediction_id', 'iptm', 'ptm', 'chain_ptm', 'chain_iptm', 'cif_filepath', 'cif_filename']]
     return AF_repository_metadata
 
+
+def open_structome_index(index_path):
+    """
+    Opens (and creates if needed) the SQLite index of AlphaFold Server summary confidences used by
+    refresh_structome_index. One index can hold several structome directories (keyed by absolute path).
+    The fold_jobs table holds the content hashes of submitted and folded jobs (see deduplicate_alphafold_jobs).
+
+    Returns:
+        connection (sqlite3.Connection): Connection to the index.
+    """
+    connection = sqlite3.connect(index_path)
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            root TEXT NOT NULL, prediction_id TEXT NOT NULL, mtime_ns INTEGER NOT NULL,
+            PRIMARY KEY (root, prediction_id));
+        CREATE TABLE IF NOT EXISTS models (
+            root TEXT NOT NULL, prediction_id TEXT NOT NULL, model_nr INTEGER NOT NULL, filename TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL,
+            iptm REAL, ptm REAL, ranking_score REAL, chain_ptm TEXT, chain_iptm TEXT,
+            PRIMARY KEY (root, prediction_id, model_nr));
+        CREATE TABLE IF NOT EXISTS fold_jobs (
+            job_hash TEXT NOT NULL, prediction_id TEXT NOT NULL, status TEXT NOT NULL, location TEXT,
+            PRIMARY KEY (job_hash, prediction_id, status));
+    """)
+    return connection
+
+
+def refresh_structome_index(AF_structure_repository_path, index_path, check_files=False):
+    """
+    Brings the index up to date with a structome directory (one folder per AlphaFold Server job).
+    Only job folders whose mtime changed since the last refresh are listed again, and within them only
+    summary_confidences files whose mtime or size changed are read; removed jobs and models are dropped.
+    A file rewritten in place does not change its folder mtime: check_files=True also stats the
+    summary_confidences files of unchanged folders (without reading them).
+    Folders with a summary file that could not be read (e.g. a partial download) are listed and read again
+    on the next refresh.
+
+    Returns:
+        stats (dict): Number of job folders seen, job folders with added, updated or removed models, summary files
+        read and summary files that could not be read.
+    """
+    root = os.path.abspath(AF_structure_repository_path)
+    stats = {'jobs': 0, 'jobs_updated': 0, 'files_read': 0, 'files_failed': 0}
+    connection = open_structome_index(index_path)
+    try:
+        with connection:
+            job_mtimes = dict(connection.execute("SELECT prediction_id, mtime_ns FROM jobs WHERE root = ?", (root,)))
+            seen = set()
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if not entry.is_dir():
+                        continue
+                    prediction_id = entry.name
+                    seen.add(prediction_id)
+                    stats['jobs'] += 1
+                    mtime_ns = entry.stat().st_mtime_ns
+                    if job_mtimes.get(prediction_id) == mtime_ns and not check_files:
+                        continue
+                    changed, complete = refresh_structome_index_job(connection, root, prediction_id,
+                                                                    rescan=job_mtimes.get(prediction_id) != mtime_ns, stats=stats)
+                    if changed:
+                        stats['jobs_updated'] += 1
+                    # an mtime of -1 never matches, so a folder with unreadable files is rescanned next time
+                    connection.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)", (root, prediction_id, mtime_ns if complete else -1))
+
+            for prediction_id in set(job_mtimes) - seen:
+                connection.execute("DELETE FROM jobs WHERE root = ? AND prediction_id = ?", (root, prediction_id))
+                connection.execute("DELETE FROM models WHERE root = ? AND prediction_id = ?", (root, prediction_id))
+    finally:
+        connection.close()
+    return stats
+
+
+def refresh_structome_index_job(connection, root, prediction_id, rescan=True, stats=None):
+    """
+    Updates the models of one job folder in the index: with rescan the folder is listed again, otherwise only
+    the indexed summary_confidences files are checked. Files are read only when their mtime or size changed.
+
+    Returns:
+        changed (bool): Whether any model was added, updated or removed.
+        complete (bool): Whether every summary_confidences file that was due could be read.
+    """
+    job_path = os.path.join(root, prediction_id)
+    indexed = {model_nr: (filename, mtime_ns, size) for model_nr, filename, mtime_ns, size in connection.execute(
+        "SELECT model_nr, filename, mtime_ns, size FROM models WHERE root = ? AND prediction_id = ?", (root, prediction_id))}
+    if rescan:
+        pattern = re.compile(rf'^fold_{re.escape(prediction_id)}_summary_confidences_(\d+)\.json$')
+        filenames = {int(match.group(1)): match.string for match in map(pattern.match, os.listdir(job_path)) if match}
+    else:
+        filenames = {model_nr: filename for model_nr, (filename, _, _) in indexed.items()}
+
+    changed = False
+    complete = True
+    for model_nr in set(indexed) - set(filenames):
+        connection.execute("DELETE FROM models WHERE root = ? AND prediction_id = ? AND model_nr = ?", (root, prediction_id, model_nr))
+        changed = True
+    for model_nr, filename in filenames.items():
+        filepath = os.path.join(job_path, filename)
+        try:
+            file_stat = os.stat(filepath)
+        except FileNotFoundError:
+            connection.execute("DELETE FROM models WHERE root = ? AND prediction_id = ? AND model_nr = ?", (root, prediction_id, model_nr))
+            changed = True
+            continue
+        if indexed.get(model_nr) == (filename, file_stat.st_mtime_ns, file_stat.st_size):
+            continue
+        try:
+            iptm, ptm, ranking_score, chain_ptm, chain_iptm = get_summary_confidence_informations(filepath)
+        except (ValueError, KeyError) as e:
+            print(f"Warning: could not read '{filepath}': {e}. Skipping...")
+            if stats is not None:
+                stats['files_failed'] += 1
+            complete = False
+            continue
+        if stats is not None:
+            stats['files_read'] += 1
+        connection.execute("INSERT OR REPLACE INTO models VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (root, prediction_id, model_nr, filename, file_stat.st_mtime_ns, file_stat.st_size,
+                            iptm, ptm, ranking_score, json.dumps(chain_ptm), json.dumps(chain_iptm)))
+        changed = True
+    return changed, complete
+
+
+def get_structome_index_table(AF_structure_repository_path, index_path, check_files=False):
+    """
+    Same flat all-models table as get_structome_confidence_table for AlphaFold Server jobs, read from the SQLite
+    index at index_path after an incremental refresh (see refresh_structome_index).
+
+    Returns:
+        confidence_df (pd.DataFrame): One row per model with the confidence_columns, sorted by prediction and model number.
+    """
+    refresh_structome_index(AF_structure_repository_path, index_path, check_files=check_files)
+
+    root = os.path.abspath(AF_structure_repository_path)
+    connection = open_structome_index(index_path)
+    try:
+        confidence_df = pd.read_sql_query(
+            "SELECT " + ", ".join(confidence_columns) + " FROM models WHERE root = ? ORDER BY prediction_id, model_nr",
+            connection, params=(root,))
+    finally:
+        connection.close()
+
+    confidence_df['chain_ptm'] = confidence_df['chain_ptm'].map(json.loads)
+    confidence_df['chain_iptm'] = confidence_df['chain_iptm'].map(json.loads)
+    return confidence_df
+
+
+def get_structome_best_model_metadata_indexed(AF_structure_repository_path, index_path, sort_by='ranking_score', check_files=False):
+    """
+    Same table as get_structome_best_model_metadata for AlphaFold Server jobs, answered from the SQLite index at
+    index_path (see get_structome_index_table and select_best_models).
+
+    Returns:
+        AF_repository_metadata (pd.DataFrame): prediction_id, iptm, ptm, chain_ptm, chain_iptm, cif_filepath
+        and cif_filename of the best model of each job.
+    """
+    confidence_df = get_structome_index_table(AF_structure_repository_path, index_path, check_files=check_files)
+    AF_repository_metadata = select_best_models(confidence_df, AF_structure_repository_path, sort_by=sort_by)
+    return AF_repository_metadata[['prediction_id', 'iptm', 'ptm', 'chain_ptm', 'chain_iptm', 'cif_filepath', 'cif_filename']]
+
+
+def get_AF3_job_seed(job_path, title):
+    """
+    Reads the model seed of an AlphaFold Server job from fold_<title>_job_request.json.
+
+    Returns:
+        seed (str): The model seed (comma-separated if the job used several), or None if unknown.
+    """
+    job_request_path = os.path.join(job_path, f'fold_{title}_job_request.json')
+    if not os.path.exists(job_request_path):
+        return None
+    with open(job_request_path, 'r') as f:
+        job_request = json.load(f)
+    if isinstance(job_request, list):
+        job_request = job_request[0] if job_request else {}
+    model_seeds = [str(seed) for seed in job_request.get('modelSeeds', [])]
+    return ','.join(model_seeds) if model_seeds else None
+
+
+def find_AF3_model_files(root_path):
+    """
+    Walks root_path for AlphaFold Server models and pairs every fold_<job>_model_<N>.cif with its
+    fold_<job>_full_data_<N>.json and fold_<job>_summary_confidences_<N>.json files.
+    Models without a full_data file (no PAE matrix) are skipped.
+
+    Returns:
+        model_files (list of dict): job, model_nr, seed, cif_filepath, full_data_filepath and
+        summary_filepath (None when missing) for each model, sorted by folder, job and model number.
+    """
+    pattern = re.compile(r'^fold_(?P<job>.+)_model_(?P<model_nr>\d+)\.cif$')
+    model_files = []
+    for dirpath, dirnames, filenames in os.walk(root_path):
+        dirnames.sort()
+        filenames = set(filenames)
+        seeds = {}
+        matches = [pattern.match(filename) for filename in filenames]
+        for match in sorted((m for m in matches if m), key=lambda m: (m['job'], int(m['model_nr']))):
+            job, model_nr = match['job'], match['model_nr']
+            full_data_filename = f'fold_{job}_full_data_{model_nr}.json'
+            if full_data_filename not in filenames:
+                continue
+            summary_filename = f'fold_{job}_summary_confidences_{model_nr}.json'
+            if job not in seeds:
+                seeds[job] = get_AF3_job_seed(dirpath, job)
+            model_files.append({'job': job,
+                                'model_nr': int(model_nr),
+                                'seed': seeds[job],
+                                'cif_filepath': os.path.join(dirpath, match.string),
+                                'full_data_filepath': os.path.join(dirpath, full_data_filename),
+                                'summary_filepath': os.path.join(dirpath, summary_filename) if summary_filename in filenames else None})
+    return model_files
+
+
+def score_AF3_model(model_files, pae_cutoff=10, dist_cutoff=15, profile_log=None):
+    """
+    Scores one model from find_AF3_model_files with ipsae; runs in the worker processes of score_AF3_models.
+    With profile_log set, the per-stage time/memory/count record of the model is appended to that file as a JSON line.
+    A model that cannot be scored (missing or malformed files) gives a single row with the error instead, so one
+    bad model does not abort the other models of score_AF3_models.
+
+    Returns:
+        rows (list of dict): one row per chain pair and type (asym/max) with the job, model_nr and seed of the model.
+    """
+    profile = ipsae.ScoreProfile(model_files['cif_filepath']) if profile_log is not None else None
+    try:
+        result = ipsae.score_files(model_files['full_data_filepath'], model_files['cif_filepath'], pae_cutoff, dist_cutoff, profile=profile)
+        rows = ipsae.summary_rows(result)
+    except Exception as e:
+        print(f"Warning: could not score '{model_files['cif_filepath']}': {type(e).__name__}: {e}. Skipping...")
+        return [{'job': model_files['job'], 'model_nr': model_files['model_nr'], 'seed': model_files['seed'],
+                 'cif_filepath': model_files['cif_filepath'], 'error': f"{type(e).__name__}: {e}"}]
+    if profile is not None:
+        profile.append_to(profile_log)
+    for row in rows:
+        row.update(job=model_files['job'], model_nr=model_files['model_nr'], seed=model_files['seed'],
+                   cif_filepath=model_files['cif_filepath'])
+    return rows
+
+
+def score_AF3_models(root_path, pae_cutoff=10, dist_cutoff=15, max_workers=None, profile_log=None):
+    """
+    Scores every AlphaFold Server model under root_path (one job folder or a bulk download of many)
+    across a pool of max_workers processes (default: one per CPU; 1 scores in this process).
+    profile_log: optional JSON-lines file that receives one stage time/memory/count record per model.
+
+    Returns:
+        scores_df (pd.DataFrame): one row per model, chain pair and type (asym/max) with job, model_nr
+        and seed columns followed by the ipsae summary columns; models that could not be scored have a
+        single row with only the error column set.
+    """
+    model_files = find_AF3_model_files(root_path)
+    if max_workers == 1 or len(model_files) < 2:
+        model_rows = map(score_AF3_model, model_files, repeat(pae_cutoff), repeat(dist_cutoff), repeat(profile_log))
+        rows = [row for rows_of_model in model_rows for row in rows_of_model]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            model_rows = executor.map(score_AF3_model, model_files, repeat(pae_cutoff), repeat(dist_cutoff), repeat(profile_log))
+            rows = [row for rows_of_model in model_rows for row in rows_of_model]
+
+    columns = ['job', 'model_nr', 'seed', 'chain1', 'chain2', 'pae_cutoff', 'dist_cutoff', 'type',
+               'ipsae', 'ipsae_d0chn', 'ipsae_d0dom', 'iptm_af', 'iptm_d0chn', 'pdockq', 'pdockq2', 'lis',
+               'n0res', 'n0chn', 'n0dom', 'd0res', 'd0chn', 'd0dom', 'nres1', 'nres2', 'dist1', 'dist2', 'cif_filepath', 'error']
+    return pd.DataFrame(rows, columns=columns)